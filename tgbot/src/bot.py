@@ -1,22 +1,25 @@
 import asyncio
-import asyncpg # type: ignore
 import logging
+import signal
 
 from aiogram import Bot, Dispatcher # type: ignore
 from aiogram.contrib.fsm_storage.memory import MemoryStorage # type: ignore
 from aiogram.contrib.fsm_storage.redis import RedisStorage # type: ignore
+from aiogram.dispatcher.webhook import get_new_configured_app # type: ignore
+from aiohttp import web # type: ignore
 #from aiogram.contrib.middlewares.logging import LoggingMiddleware  # type: ignore #comment to switch off bot logging
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler # type: ignore
-
-from tgbot.config import load_config
+from tgbot.config import WebhookConfig, load_config
 from tgbot.filters.role import RoleFilter, AdminFilter
 from tgbot.handlers.admin import register_admin
 from tgbot.handlers.user import register_user, start_menu, feed_list, feed_delete, feed_edit, rss_feed_create_button, rss_feed_create, \
                                 html_feed_create_button, html_feed_create, search_add_button, search_add, search_delete, subscription_start, \
-                                subscription_stop, subscription_items
+                                subscription_stop
 from tgbot.middlewares.db import DbMiddleware
 from tgbot.middlewares.role import RoleMiddleware
+from tgbot.services.connection import create_pool
+from tgbot.services.shared_cache import create_shared_cache
+from tgbot.services.worker import Worker
 
 def _log(obj) -> None:
     logging.basicConfig(
@@ -27,15 +30,32 @@ def _log(obj) -> None:
     logger.error(obj)
 
 
-async def subscription_loop(dp: Dispatcher, pool) -> None:
-    items = await subscription_items(pool)
-    #_log(items)
-    for item in items:
-        await dp.bot.send_message(int(item[0]), item[1])
-
-
-def schedule_jobs(scheduler, dp, pool):
-    scheduler.add_job(subscription_loop, "interval", seconds=300, args=(dp, pool))
+async def run_webhook(dp: Dispatcher, webhook: WebhookConfig) -> None:
+    """Serve the updates posted by Telegram until SIGINT or SIGTERM.
+    Every request is processed in its own task, Telegram sends up to max_connections of them at once"""
+    path = f"{webhook.path.rstrip('/')}/{webhook.secret}" if webhook.secret else webhook.path
+    app = get_new_configured_app(dp, path)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, webhook.host, webhook.port, shutdown_timeout=webhook.shutdown_timeout)
+    await site.start()
+    if webhook.url: #without a public url the endpoint only takes updates posted locally
+        await dp.bot.set_webhook(
+            webhook.url.rstrip("/") + path,
+            max_connections=webhook.max_connections,
+        )
+    _log(f"Listening for updates on {webhook.host}:{webhook.port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        #stop accepting updates and let the requests in flight finish, Telegram resends the unanswered ones.
+        #the webhook itself stays registered for the other replicas and the next start
+        await runner.cleanup()
 
 
 async def main():
@@ -47,15 +67,8 @@ async def main():
     else:
         storage = MemoryStorage()
     
-    pool = await asyncpg.create_pool(
-        user=config.db.user,
-        password=config.db.password,
-        database=config.db.database,
-        host=config.db.host,
-        #echo=False,
-    )
-    
-
+    pool = await create_pool(config)
+    shared = await create_shared_cache(config.cache)
     bot = Bot(token=config.tg_bot.token)
     dp = Dispatcher(bot, storage=storage)
     dp.middleware.setup(DbMiddleware(pool))
@@ -64,10 +77,7 @@ async def main():
     dp.filters_factory.bind(RoleFilter)
     dp.filters_factory.bind(AdminFilter)
 
-    scheduler = AsyncIOScheduler()
-    #logging.getLogger('apscheduler').setLevel(logging.DEBUG) #comment to switch off the apscheduler logging
-    schedule_jobs(scheduler, dp, pool)
-    
+    worker = Worker(config, pool, bot, shared) if config.worker.embedded else None #otherwise worker.py polls the feeds
 
     register_admin(dp)
     register_user(dp)
@@ -88,12 +98,21 @@ async def main():
 
     # start
     try:
-        scheduler.start()
-        await dp.start_polling()
+        if worker is not None:
+            await worker.start()
+        if config.webhook.enabled:
+            await run_webhook(dp, config.webhook)
+        else:
+            await dp.start_polling()
     finally:
+        if worker is not None:
+            await worker.close()
         await dp.storage.close()
         await dp.storage.wait_closed()
         await bot.session.close()
+        if shared is not None:
+            await shared.close()
+        await pool.close()
 
 
 if __name__ == '__main__':
@@ -10,6 +10,15 @@ class DbConfig:
     database: str
 
 
+@dataclass
+class PoolConfig:
+    min_size: int
+    max_size: int
+    max_inactive_connection_lifetime: float
+    statement_cache_size: int
+    max_cached_statement_lifetime: float
+
+
 @dataclass
 class TgBot:
     token: str
@@ -17,10 +26,119 @@ class TgBot:
     use_redis: bool
 
 
+@dataclass
+class WebhookConfig:
+    enabled: bool
+    url: str
+    host: str
+    port: int
+    path: str
+    secret: str
+    max_connections: int
+    shutdown_timeout: float
+
+
+@dataclass
+class WorkerConfig:
+    embedded: bool
+    exclusive: bool
+    interval: float
+    feed_lease: float
+
+
+@dataclass
+class PollConfig:
+    min_interval: float
+    max_interval: float
+    history: int
+    search_interval: float
+
+
+@dataclass
+class HealthConfig:
+    failure_threshold: int
+    cooldown: float
+    max_cooldown: float
+
+
+@dataclass
+class FetchConfig:
+    concurrency: int
+    per_host: int
+    timeout: float
+    parse_workers: int
+    max_bytes: int
+    max_entries: int
+
+
+@dataclass
+class SearchConfig:
+    interval: float
+    ttl: float
+    num_results: int
+    backoff: float
+    max_backoff: float
+    timeout: float
+
+
+@dataclass
+class CacheConfig:
+    sent_links: int
+    shared: str
+    redis_address: str
+    validator_ttl: float
+
+
+@dataclass
+class PipelineConfig:
+    queue_size: int
+    page_size: int
+    fetch_workers: int
+    match_workers: int
+    dedupe_workers: int
+    persist_workers: int
+    schedule_refresh: float
+
+
+@dataclass
+class DeliveryConfig:
+    rate: float
+    chat_interval: float
+    digest_size: int
+    max_retries: int
+
+
+@dataclass
+class OutboxConfig:
+    batch_size: int
+    interval: float
+    lease: float
+    max_attempts: int
+
+
+@dataclass
+class ReaperConfig:
+    interval: float
+    batch_size: int
+    pause: float
+
+
 @dataclass
 class Config:
     tg_bot: TgBot
     db: DbConfig
+    pool: PoolConfig
+    webhook: WebhookConfig
+    worker: WorkerConfig
+    poll: PollConfig
+    health: HealthConfig
+    fetch: FetchConfig
+    cache: CacheConfig
+    search: SearchConfig
+    pipeline: PipelineConfig
+    delivery: DeliveryConfig
+    outbox: OutboxConfig
+    reaper: ReaperConfig
 
 
 def cast_bool(value: str) -> bool:
@@ -42,4 +160,86 @@ def load_config(path: str):
             use_redis=cast_bool(tg_bot.get("use_redis")),
         ),
         db=DbConfig(**config["db"]),
+        pool=PoolConfig(
+            min_size=config.getint("pool", "min_size", fallback=2),
+            max_size=config.getint("pool", "max_size", fallback=10),
+            max_inactive_connection_lifetime=config.getfloat("pool", "max_inactive_connection_lifetime", fallback=300),
+            statement_cache_size=config.getint("pool", "statement_cache_size", fallback=100),
+            max_cached_statement_lifetime=config.getfloat("pool", "max_cached_statement_lifetime", fallback=300),
+        ),
+        webhook=WebhookConfig(
+            enabled=config.getboolean("webhook", "enabled", fallback=False),
+            url=config.get("webhook", "url", fallback=""),
+            host=config.get("webhook", "host", fallback="0.0.0.0"),
+            port=config.getint("webhook", "port", fallback=8080),
+            path=config.get("webhook", "path", fallback="/webhook"),
+            secret=config.get("webhook", "secret", fallback=""),
+            max_connections=config.getint("webhook", "max_connections", fallback=40),
+            shutdown_timeout=config.getfloat("webhook", "shutdown_timeout", fallback=30),
+        ),
+        worker=WorkerConfig(
+            embedded=config.getboolean("worker", "embedded", fallback=True),
+            exclusive=config.getboolean("worker", "exclusive", fallback=True),
+            interval=config.getfloat("worker", "interval", fallback=300),
+            feed_lease=config.getfloat("worker", "feed_lease", fallback=240),
+        ),
+        poll=PollConfig(
+            min_interval=config.getfloat("poll", "min_interval", fallback=60),
+            max_interval=config.getfloat("poll", "max_interval", fallback=86400),
+            history=config.getint("poll", "history", fallback=10),
+            search_interval=config.getfloat("poll", "search_interval", fallback=3600),
+        ),
+        health=HealthConfig(
+            failure_threshold=config.getint("health", "failure_threshold", fallback=3),
+            cooldown=config.getfloat("health", "cooldown", fallback=600),
+            max_cooldown=config.getfloat("health", "max_cooldown", fallback=86400),
+        ),
+        fetch=FetchConfig(
+            concurrency=config.getint("fetch", "concurrency", fallback=20),
+            per_host=config.getint("fetch", "per_host", fallback=2),
+            timeout=config.getfloat("fetch", "timeout", fallback=30),
+            parse_workers=config.getint("fetch", "parse_workers", fallback=2),
+            max_bytes=config.getint("fetch", "max_bytes", fallback=2000000),
+            max_entries=config.getint("fetch", "max_entries", fallback=200),
+        ),
+        cache=CacheConfig(
+            sent_links=config.getint("cache", "sent_links", fallback=100000),
+            shared=config.get("cache", "shared", fallback="none"),
+            redis_address=config.get("cache", "redis_address", fallback="redis://localhost"),
+            validator_ttl=config.getfloat("cache", "validator_ttl", fallback=86400),
+        ),
+        search=SearchConfig(
+            interval=config.getfloat("search", "interval", fallback=2),
+            ttl=config.getfloat("search", "ttl", fallback=3600),
+            num_results=config.getint("search", "num_results", fallback=5),
+            backoff=config.getfloat("search", "backoff", fallback=30),
+            max_backoff=config.getfloat("search", "max_backoff", fallback=3600),
+            timeout=config.getfloat("search", "timeout", fallback=30),
+        ),
+        pipeline=PipelineConfig(
+            queue_size=config.getint("pipeline", "queue_size", fallback=100),
+            page_size=config.getint("pipeline", "page_size", fallback=100),
+            fetch_workers=config.getint("pipeline", "fetch_workers", fallback=20),
+            match_workers=config.getint("pipeline", "match_workers", fallback=2),
+            dedupe_workers=config.getint("pipeline", "dedupe_workers", fallback=4),
+            persist_workers=config.getint("pipeline", "persist_workers", fallback=2),
+            schedule_refresh=config.getfloat("pipeline", "schedule_refresh", fallback=900),
+        ),
+        delivery=DeliveryConfig(
+            rate=config.getfloat("delivery", "rate", fallback=30),
+            chat_interval=config.getfloat("delivery", "chat_interval", fallback=1),
+            digest_size=config.getint("delivery", "digest_size", fallback=10),
+            max_retries=config.getint("delivery", "max_retries", fallback=3),
+        ),
+        outbox=OutboxConfig(
+            batch_size=config.getint("outbox", "batch_size", fallback=100),
+            interval=config.getfloat("outbox", "interval", fallback=10),
+            lease=config.getfloat("outbox", "lease", fallback=300),
+            max_attempts=config.getint("outbox", "max_attempts", fallback=5),
+        ),
+        reaper=ReaperConfig(
+            interval=config.getfloat("reaper", "interval", fallback=3600),
+            batch_size=config.getint("reaper", "batch_size", fallback=1000),
+            pause=config.getfloat("reaper", "pause", fallback=1),
+        ),
     )
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 import logging
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from aiogram import Dispatcher # type: ignore
 from aiogram.dispatcher import FSMContext # type: ignore
@@ -8,7 +8,7 @@ from aiogram.dispatcher.filters.state import State, StatesGroup # type: ignore
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery # type: ignore
 from aiogram.utils.callback_data import CallbackData # type: ignore
 
-from tgbot.models.link import LinkData
+from tgbot.models.health import HealthData
 from tgbot.models.role import UserRole
 from tgbot.services.repository import Repo
 from tgbot.services.feed import Feed
@@ -50,20 +50,20 @@ def get_keyboard_home():
     return keyboard
 
 
-def get_keyboard_feedlist(line:int):
-    # Generate keyboard
+def get_keyboard_feedlist(first_key:int, last_key:int):
+    # Generate keyboard, the line is the key of the feed the next page starts after (or ends before)
     buttons = [
         InlineKeyboardButton(
             text="Previous", 
             callback_data=cb.new(
-                line = int(line)-10,
-                action = "feed_list",
+                line = int(first_key),
+                action = "feed_list_back",
             )
         ),
         InlineKeyboardButton(
             text="Next", 
             callback_data=cb.new(
-                line = int(line)+10,
+                line = int(last_key),
                 action = "feed_list",
             )
         ),
@@ -115,21 +115,32 @@ async def menu_start(call: CallbackQuery, state: FSMContext):
     await call.answer()
 
 
+def _health_status(health: Optional[HealthData]) -> str:
+    if health is None:
+        return "ok"
+    status = f"failing, {health.failures} errors in a row, last: {health.last_error}"
+    if health.open_until is not None and health.open_until > datetime.now(timezone.utc):
+        status += f", paused until {health.open_until:%Y-%m-%d %H:%M} UTC"
+    return status
+
+
 async def list_feed(call: CallbackQuery, state: FSMContext, callback_data: dict, feed: Feed):
-    #feeds = await feed.list_feeds(call.from_user.id, int(callback_data["line"]), False, "ANY('{html, rss}')")
-    feeds = await feed.list_feeds(call["message"]["chat"]["id"], int(callback_data["line"]), False, "ANY('{html, rss}')")
+    #feeds = await feed.list_feeds(call.from_user.id, int(callback_data["line"]), backward=callback_data["action"] == "feed_list_back")
+    feeds = await feed.list_feeds(call["message"]["chat"]["id"], int(callback_data["line"]), backward=callback_data["action"] == "feed_list_back")
     if not feeds:
         await call.message.answer("End of feeds list")
     else:
         await state.update_data(feedlist=feeds)
+        health = await feed.get_health([row.feed_link for row in feeds])
         feeds_message = [
             f"{row.id}. {row.feed_link}: {row.search_string} ({row.feed_type})\n"
+            f"Status: {_health_status(health.get(row.feed_link))}\n"
             f"Delete: /delfeed{row.id}, Edit: /edit{row.id} \n\n" 
             for row in feeds
             ]
         await call.message.answer(
             "".join(feeds_message),
-            reply_markup=get_keyboard_feedlist(callback_data["line"]),
+            reply_markup=get_keyboard_feedlist(feeds[0].key, feeds[-1].key),
             )
     await call.answer()
 
@@ -328,34 +339,6 @@ async def stop_subscription(call: CallbackQuery, state: FSMContext, repo: Repo):
     await call.answer() 
 
 
-async def subscription_items(pool) -> List[Tuple]:
-    db = await pool.acquire()
-    repo = Repo(db)
-    feed = Feed(db)
-    link = Link(db)
-    users = await repo.list_active_users()
-    result: List = []
-    await link.clear_old_link() # delete old saved links
-    for user in users:
-        user = user["id"]
-        new_items = await feed.new_rss_items(int(user), repo, link)
-        new_items.extend(
-            await feed.new_google_search(int(user), link)
-            )
-        #await repo.set_last_sent(int(user), datetime.now(timezone.utc)) #the user.last_sent field is not used at the moment
-        for item in new_items:
-            sent_link = LinkData(
-                user,
-                item,
-                datetime.now(timezone.utc)
-            )
-            await link.save_link(sent_link)
-            user_item = (user, item)
-            result.append(user_item)
-    await db.close()
-    return result
-
-
 def register_user(dp: Dispatcher):
     dp.register_message_handler(user_start, commands=["start"], state="*", role=UserRole.USER)
     #dp.register_channel_post_handler(user_start, lambda message: message.text.startswith('/start'), state="*", role=UserRole.USER)
@@ -366,7 +349,7 @@ def start_menu(dp: Dispatcher):
 
 
 def feed_list(dp: Dispatcher):
-    dp.register_callback_query_handler(list_feed, cb.filter(action=["feed_list"]))
+    dp.register_callback_query_handler(list_feed, cb.filter(action=["feed_list", "feed_list_back"]))
 
 
 def feed_delete(dp: Dispatcher):
@@ -1,5 +1,6 @@
 from aiogram.dispatcher.middlewares import LifetimeControllerMiddleware # type: ignore
 
+from tgbot.services.connection import LazyConnection
 from tgbot.services.repository import Repo
 from tgbot.services.feed import Feed
 from tgbot.services.link import Link
@@ -13,7 +14,7 @@ class DbMiddleware(LifetimeControllerMiddleware):
         self.pool = pool
 
     async def pre_process(self, obj, data, *args):
-        db = await self.pool.acquire()
+        db = LazyConnection(self.pool) #no connection is taken until a handler runs a query
         data["db"] = db
         data["repo"] = Repo(db)
         data["feed"] = Feed(db)
@@ -23,6 +24,3 @@ class DbMiddleware(LifetimeControllerMiddleware):
         del data["repo"]
         del data["feed"]
         del data["link"]
-        db = data.get("db")
-        if db:
-            await db.close()
@@ -0,0 +1,7 @@
+from datetime import datetime
+from typing import NamedTuple
+
+class EntryData(NamedTuple):
+    link: str
+    published: datetime
+    text: str #normalized title and content for matching
\ No newline at end of file
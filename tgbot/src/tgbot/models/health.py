@@ -0,0 +1,9 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+class HealthData(NamedTuple):
+    feed_link: str
+    failures: int #consecutive failures, the row is dropped once the feed works again
+    last_error: str
+    last_failure: datetime
+    open_until: Optional[datetime] #the circuit breaker skips the feed until then
\ No newline at end of file
@@ -0,0 +1,10 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+class OutboxData(NamedTuple):
+    key: Optional[int]
+    user_id: int
+    article_link: str
+    feed_link: str
+    created: datetime
+    due: Optional[datetime] #None for the users who are not due, they wait for their next digest
\ No newline at end of file
@@ -0,0 +1,9 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+class ValidatorData(NamedTuple):
+    feed_link: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    watermark: Optional[datetime] = None #entries up to it were skipped when the content was parsed
\ No newline at end of file
@@ -0,0 +1,69 @@
+import asyncpg # type: ignore
+import logging
+
+from tgbot.config import Config
+from tgbot.services.migrations import Migrations
+from tgbot.services.queries import QUERIES
+from typing import Any, List, Optional
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class LazyConnection:
+    """Connection-like provider for the services: a pool connection is taken only when a query runs
+    and is given back to the pool right after it"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+
+    async def _run(self, method: str, *args, **kwargs) -> Any:
+        async with self.pool.acquire() as conn:
+            return await getattr(conn, method)(*args, **kwargs)
+
+
+    async def execute(self, query: str, *args, **kwargs) -> str:
+        return await self._run("execute", query, *args, **kwargs)
+
+
+    async def executemany(self, query: str, args, **kwargs) -> None:
+        return await self._run("executemany", query, args, **kwargs)
+
+
+    async def fetch(self, query: str, *args, **kwargs) -> List:
+        return await self._run("fetch", query, *args, **kwargs)
+
+
+    async def fetchrow(self, query: str, *args, **kwargs) -> Optional[Any]:
+        return await self._run("fetchrow", query, *args, **kwargs)
+
+
+    async def fetchval(self, query: str, *args, **kwargs) -> Any:
+        return await self._run("fetchval", query, *args, **kwargs)
+
+
+async def create_pool(config: Config):
+    """Connect to the database and bring the schema up to date"""
+    pool = await asyncpg.create_pool(
+        user=config.db.user,
+        password=config.db.password,
+        database=config.db.database,
+        host=config.db.host,
+        min_size=config.pool.min_size,
+        max_size=config.pool.max_size,
+        max_inactive_connection_lifetime=config.pool.max_inactive_connection_lifetime,
+        statement_cache_size=config.pool.statement_cache_size,
+        max_cached_statement_lifetime=config.pool.max_cached_statement_lifetime,
+        #echo=False,
+    )
+    if config.pool.statement_cache_size < len(QUERIES):
+        _log(f"statement_cache_size {config.pool.statement_cache_size} is below the {len(QUERIES)} registered queries, they will be prepared again")
+    async with pool.acquire() as conn:
+        await Migrations(conn).run()
+    return pool
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError # type: ignore
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MESSAGE_LENGTH = 4096 #telegram limit for a text message
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+@dataclass
+class _Chat:
+    pending: List[Tuple[str, asyncio.Future]] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    next_at: float = 0.0
+
+
+class Delivery:
+    """Rate-limited Telegram delivery.
+    Links waiting for the same chat are coalesced into digest messages"""
+
+    def __init__(self, bot, rate: float = 30, chat_interval: float = 1.0, digest_size: int = 10, max_retries: int = 3):
+        self.bot = bot
+        self.interval = 1 / rate
+        self.chat_interval = chat_interval
+        self.digest_size = digest_size
+        self.max_retries = max_retries
+        self._chats: Dict[int, _Chat] = {}
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+
+    async def send(self, chat_id: int, links: Iterable[str]) -> Set[str]:
+        """Queue the links for the chat and return the ones which have been delivered"""
+        loop = asyncio.get_running_loop()
+        chat = self._chats.setdefault(int(chat_id), _Chat())
+        requests = [(link, loop.create_future()) for link in links]
+        chat.pending.extend(requests)
+        if chat.task is None or chat.task.done():
+            chat.task = asyncio.create_task(self._drain(int(chat_id), chat))
+        results = await asyncio.gather(*(future for _, future in requests))
+        return {link for (link, _), delivered in zip(requests, results) if delivered}
+
+
+    def _next_digest(self, chat: _Chat) -> List[Tuple[str, asyncio.Future]]:
+        digest: List[Tuple[str, asyncio.Future]] = []
+        length = 0
+        while chat.pending and len(digest) < self.digest_size:
+            link_length = len(chat.pending[0][0]) + 1
+            if digest and length + link_length > MESSAGE_LENGTH:
+                break
+            digest.append(chat.pending.pop(0))
+            length += link_length
+        return digest
+
+
+    async def _drain(self, chat_id: int, chat: _Chat) -> None:
+        loop = asyncio.get_running_loop()
+        digest: List[Tuple[str, asyncio.Future]] = []
+        try:
+            while True:
+                wait = chat.next_at - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait) #the links queued meanwhile join the digest
+                if not chat.pending:
+                    break
+                digest = self._next_digest(chat)
+                delivered = await self._send_digest(chat_id, "\n".join(link for link, _ in digest))
+                chat.next_at = loop.time() + self.chat_interval
+                for _, future in digest:
+                    if not future.done():
+                        future.set_result(delivered)
+        except Exception as e:
+            _log(f"Delivery to {chat_id} has stopped: {e!r}")
+        finally:
+            #whatever stopped the loop, no sender is left waiting for its links
+            for _, future in digest + chat.pending:
+                if not future.done():
+                    future.set_result(False)
+            chat.pending = []
+            if self._chats.get(chat_id) is chat:
+                del self._chats[chat_id]
+
+
+    async def _throttle(self) -> None:
+        """Keep the global message rate"""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            wait = self._next_at - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_at = max(loop.time(), self._next_at) + self.interval
+
+
+    async def _send_digest(self, chat_id: int, text: str) -> bool:
+        for _ in range(self.max_retries + 1):
+            await self._throttle()
+            try:
+                await self.bot.send_message(chat_id, text)
+                return True
+            except RetryAfter as e:
+                _log(f"Flood control for {chat_id}, retry in {e.timeout}s")
+                await asyncio.sleep(e.timeout)
+            except (TelegramAPIError, asyncio.TimeoutError) as e:
+                _log(f"Failed to deliver to {chat_id}: {e!r}")
+                return False
+        return False
@@ -1,13 +1,14 @@
-import feedparser # type: ignore
-from googlesearch import search # type: ignore
+import asyncio
 import logging
 
 from datetime import datetime, timezone, timedelta
+from tgbot.models.entry import EntryData
 from tgbot.models.feed import FeedData
-from tgbot.services.link import Link
-from tgbot.services.repository import Repo
-from time import mktime
-from typing import List
+from tgbot.models.health import HealthData
+from tgbot.services import queries
+from tgbot.services.matcher import MatcherCache
+from tgbot.services.search import SearchPlanner
+from typing import Dict, List, Optional, Sequence, Tuple
 
 def _log(obj) -> None:
     logging.basicConfig(
@@ -36,73 +37,185 @@ class Feed:
         return search_str
 
 
-    async def new_rss_items(self, user_id, repo: Repo, link: Link) -> List[str]:
-        """List new RSS feed items for the user"""
-        result: List = []
-        feeds = await self.list_feeds(user_id, 0, True, "'rss'")
-        #last_sent: datetime = await repo.get_last_sent(user_id) #the user.last_sent field is not used at the moment
-        for feed in feeds:
-            fp = feedparser.parse(feed.feed_link)
-            for entry in fp.entries:
-                if "published" in fp.entries[0]:
-                    entry_published = datetime.fromtimestamp(mktime(entry.published_parsed), timezone.utc)
-                else:
-                    entry_published = datetime.fromtimestamp(mktime(entry.updated_parsed), timezone.utc)
-                #check if the rss entry date is later then the feed last updated for this user
-                if entry_published > feed.last_updated: 
-                    #check that keywords are in the title or content
-                    if (any(x in entry.title.lower() for x in feed.search_string)) or ("content" in fp.entries[0] and any(x in entry.content[0].value.lower() for x in feed.search_string)): 
-                        #check that link has not been sent yet
-                        if not await link.is_sent(user_id, entry.link):
-                            await self.update_last_updated(int(user_id), feed.feed_link, datetime.now(timezone.utc))
-                            result.append(entry.link)
-        return result
+    def match_rss_items(self, feeds: List[FeedData], entries: List[EntryData], matchers: MatcherCache,
+                        watermarks: Optional[Dict[int, datetime]] = None) -> Dict[Tuple[int, str], str]:
+        """Match the parsed entries of one RSS feed against all its subscribers.
+        Each entry is scanned once, returns (user, article link) -> feed link in the feed order.
+        The newest entry timestamp seen by every subscriber is collected into watermarks"""
+        candidates: Dict[Tuple[int, str], str] = {}
+        feed_link = feeds[0].feed_link
+        #keyed by subscription, a user may follow the same link twice with different keywords
+        matcher = matchers.get(feed_link, {feed.key: feed.search_string for feed in feeds})
+        for entry in entries:
+            entry_published = entry.published
+            #check if the rss entry date is later then the feed last updated for the user
+            subscribers = [feed for feed in feeds if entry_published > feed.last_updated]
+            if not subscribers:
+                continue
+            if watermarks is not None:
+                for feed in subscribers:
+                    if entry_published > watermarks.get(feed.user_id, feed.last_updated):
+                        watermarks[feed.user_id] = entry_published
+            #check that keywords are in the title or content
+            matched = matcher.match(entry.text)
+            for feed in subscribers:
+                if feed.key in matched:
+                    candidates.setdefault((feed.user_id, entry.link), feed_link)
+        return candidates
             
 
-    async def new_google_search(self, user_id, link: Link) -> List[str]:
-        result: List = []
-        feeds = await self.list_feeds(user_id, 0, True, "'html'")
+    async def search_google_items(self, feeds: List[FeedData], planner: SearchPlanner) -> Dict[Tuple[int, str], str]:
+        """Search the site of one html feed for the keywords of all its subscribers.
+        Each keyword is searched once, returns (user, article link) -> feed link in the search order"""
+        candidates: Dict[Tuple[int, str], str] = {}
+        feed_link = feeds[0].feed_link
+        keywords = list(dict.fromkeys(search_string for feed in feeds for search_string in feed.search_string))
+        #the planner throttles the queries and shares them with the other feeds of the site
+        found = await asyncio.gather(*(planner.search(keyword, feed_link) for keyword in keywords))
+        results: Dict[str, List[str]] = dict(zip(keywords, found))
         for feed in feeds:
             for search_string in feed.search_string:
-                gs = search(f"{search_string} site:{feed.feed_link} after:{datetime.today().strftime('%Y-%m-%d')}", num_results=5) #returns a list of article links
-                for search_result in gs:
-                    #check that link has not been sent yet
-                    if not await link.is_sent(user_id, search_result):
-                        await self.update_last_updated(int(user_id), feed.feed_link, datetime.now(timezone.utc))
-                        result.append(search_result)
-        return result
-
-
-    async def list_feeds(self, user_id, line:int, all: bool, type: str) -> List[FeedData]:
-        """List the current user's feeds"""
-        result = []
-        rows = await self.conn.fetch(
-            f"SELECT * FROM feeds WHERE user_id = $1 and feed_type = {type} order by key asc",
-            user_id,
+                for search_result in results[search_string]:
+                    candidates.setdefault((feed.user_id, search_result), feed_link)
+        return candidates
+
+
+    def _feed_from_row(self, index: int, row) -> FeedData:
+        return FeedData(
+            index,
+            row["key"],
+            row["user_id"], 
+            row["feed_link"], 
+            row["feed_type"], 
+            self._parse_search_string(row["search_string"]), 
+            row["last_updated"],
+            ) 
+
+
+    async def list_feeds(self, user_id, key: int = 0, limit: int = 10, types: Sequence[str] = ("rss", "html"), backward: bool = False) -> List[FeedData]:
+        """List one page of the user's feeds after the key (keyset pagination), or before it with backward"""
+        if backward:
+            rows = await queries.LIST_FEEDS_BEFORE.fetch(
+                self.conn,
+                int(user_id),
+                list(types),
+                key,
+                limit,
+            )
+            rows = list(reversed(rows))
+        else:
+            rows = await queries.LIST_FEEDS_AFTER.fetch(
+                self.conn,
+                int(user_id),
+                list(types),
+                key,
+                limit,
+            )
+        if not rows:
+            return []
+        #rows are numbered by their position in the whole list, so the numbers keep counting across pages
+        offset = await queries.COUNT_FEEDS_BEFORE.fetchrow(
+            self.conn,
+            int(user_id),
+            list(types),
+            rows[0]["key"],
         )
-        if rows and 0 <= line < len(rows): 
-            if (line + 9) < len(rows) and not all: # paginated list
-                end = line + 10
-            else: # full list
-                end = len(rows)
-            for index, row in enumerate(rows[line:end], start=line):
-                feed = FeedData(
-                    index,
-                    row["key"],
-                    row["user_id"], 
-                    row["feed_link"], 
-                    row["feed_type"], 
-                    self._parse_search_string(row["search_string"]), 
-                    row["last_updated"],
-                    ) 
-                result.append(feed)
-        return result
+        return [self._feed_from_row(index, row) for index, row in enumerate(rows, start=offset["feeds_before"])]
+
+
+    async def list_active_subscriptions(self, user_ids: Optional[List[int]] = None, after: Tuple[str, str] = ("", ""),
+                                        limit: int = 100) -> List[Tuple[str, str, List[FeedData]]]:
+        """List one page of up to limit feeds of the active users after (feed type, feed link) (keyset pagination),
+        grouped as (feed type, feed link, subscriptions). With user_ids only the feeds followed by these users
+        are listed, still with all their active subscribers"""
+        rows = await queries.LIST_ACTIVE_SUBSCRIPTIONS.fetch(
+            self.conn,
+            [int(user_id) for user_id in user_ids] if user_ids is not None else None,
+            after[0],
+            after[1],
+            limit,
+        )
+        groups: List[Tuple[str, str, List[FeedData]]] = []
+        group: List[FeedData] = []
+        for row in rows:
+            if group and (group[0].feed_type, group[0].feed_link) != (row["feed_type"], row["feed_link"]):
+                groups.append((group[0].feed_type, group[0].feed_link, group))
+                group = []
+            group.append(self._feed_from_row(len(group), row))
+        if group:
+            groups.append((group[0].feed_type, group[0].feed_link, group))
+        return groups
+
+
+    async def list_active_feed_links(self, type: str) -> List[str]:
+        """List the distinct feed links followed by the active users"""
+        rows = await queries.LIST_ACTIVE_FEED_LINKS.fetch(
+            self.conn,
+            type,
+        )
+        return [row["feed_link"] for row in rows]
+
+
+    async def claim_feed(self, link: str, owner: str, lease: timedelta) -> bool:
+        """Take the feed for the lease time, fails while another worker holds it"""
+        rows = await queries.CLAIM_FEED.fetch(
+            self.conn,
+            link,
+            owner,
+            datetime.now(timezone.utc) + lease,
+        )
+        return bool(rows)
+
+
+    async def list_failing_feeds(self) -> Dict[str, HealthData]:
+        """Health of the feeds whose last polls have failed, the others are healthy"""
+        rows = await queries.LIST_FAILING_FEEDS.fetch(self.conn)
+        return {row["feed_link"]: HealthData(*row) for row in rows}
+
+
+    async def get_health(self, links: List[str]) -> Dict[str, HealthData]:
+        rows = await queries.GET_FEED_HEALTH.fetch(
+            self.conn,
+            links,
+        )
+        return {row["feed_link"]: HealthData(*row) for row in rows}
+
+
+    async def record_failure(self, link: str, error: str, threshold: int = 3, cooldown: float = 600,
+                             max_cooldown: float = 86400) -> HealthData:
+        """Count one more failure in a row, from the threshold on the circuit is opened for a cooldown
+        doubled with every further failure"""
+        now = datetime.now(timezone.utc)
+        row = await queries.RECORD_FEED_FAILURE.fetchrow(
+            self.conn,
+            link,
+            error[:500],
+            now,
+        )
+        health = HealthData(*row)
+        if health.failures >= threshold:
+            seconds = min(cooldown * 2 ** (health.failures - threshold), max_cooldown)
+            health = health._replace(open_until=now + timedelta(seconds=seconds))
+            await queries.OPEN_FEED_CIRCUIT.execute(
+                self.conn,
+                link,
+                health.open_until,
+            )
+        return health
+
+
+    async def clear_health(self, link: str) -> None:
+        """The feed works again, close its circuit"""
+        await queries.CLEAR_FEED_HEALTH.execute(
+            self.conn,
+            link,
+        )
+
 
-    
     async def feed_exists(self, user_id: int, link: str) -> bool:
         """Checks if a feed with the link already exists for the user"""
-        rows = await self.conn.fetch(
-            "SELECT feed_link FROM feeds WHERE user_id = $1 and feed_link = $2 order by key asc",
+        rows = await queries.FEED_EXISTS.fetch(
+            self.conn,
             user_id,
             link,
         )
@@ -111,10 +224,8 @@ class Feed:
 
     async def create_feed(self, search_strings: List[str], user_id: int, link: str, type: str) -> None:
         feed_type = type
-        await self.conn.execute('''
-            insert into feeds (user_id, key, feed_link, feed_type, search_string, last_updated)
-            values ($1, DEFAULT, $2, $3, $4, $5)
-            ''',
+        await queries.CREATE_FEED.execute(
+            self.conn,
             int(user_id),
             link,
             feed_type,
@@ -125,8 +236,8 @@ class Feed:
 
 
     async def delete_feeds(self, user_id: int, link: str) -> None:
-        await self.conn.execute(
-            "delete from feeds where user_id=$1 and feed_link=$2",
+        await queries.DELETE_FEED.execute(
+            self.conn,
             int(user_id),
             link,
             )
@@ -134,21 +245,24 @@ class Feed:
 
 
     async def update_search(self, search_strings: List[str], user_id: int, link: str) -> None:
-        await self.conn.execute(
-            "update feeds set search_string=$1 where user_id=$2 and feed_link=$3",
+        await queries.UPDATE_SEARCH.execute(
+            self.conn,
             self._search_list_to_string(search_strings),
+            datetime.now(timezone.utc) - timedelta(days=30), #rescan the recent entries for the new keywords
             int(user_id),
             link,
             )
-        await self.update_last_updated(user_id, link, datetime.now(timezone.utc) - timedelta(days=30))
         return
 
 
-    async def update_last_updated(self, user_id: int, link: str, timestamp: datetime) -> None:
-        await self.conn.execute(
-            "update feeds set last_updated=$1 where user_id=$2 and feed_link=$3",
-            timestamp,
-            int(user_id),
-            link
+    async def update_last_updated_bulk(self, watermarks: Dict[Tuple[int, str], datetime]) -> None:
+        """Move last_updated of many (user, feed link) pairs forward in one statement, it never goes back"""
+        if not watermarks:
+            return
+        await queries.UPDATE_LAST_UPDATED_BULK.execute(
+            self.conn,
+            [int(user_id) for user_id, _ in watermarks.keys()],
+            [feed_link for _, feed_link in watermarks.keys()],
+            list(watermarks.values()),
             )
         return
\ No newline at end of file
@@ -0,0 +1,125 @@
+import calendar
+import feedparser # type: ignore
+import xml.etree.ElementTree as ET
+
+from datetime import datetime, timezone
+from feedparser.datetimes import _parse_date # type: ignore #the date formats feedparser understands
+from tgbot.models.entry import EntryData
+from tgbot.services.matcher import normalize_text
+from typing import Any, List, Optional
+from urllib.parse import urljoin
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+RSS1 = "{http://purl.org/rss/1.0/}"
+ROOT_TAGS = {"rss", "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}RDF", f"{ATOM}feed"}
+ENTRY_TAGS = {"item", f"{RSS1}item", f"{ATOM}entry"}
+TITLE_TAGS = {"title", f"{RSS1}title", f"{ATOM}title"}
+CONTENT_TAGS = {"{http://purl.org/rss/1.0/modules/content/}encoded", f"{ATOM}content"}
+PUBLISHED_TAGS = {"pubDate", f"{ATOM}published", "{http://purl.org/dc/elements/1.1/}date"}
+UPDATED_TAGS = {f"{ATOM}updated"}
+CHUNK_SIZE = 65536
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    parsed = _parse_date(value.strip()) if value else None
+    if parsed is None:
+        return None
+    return datetime.fromtimestamp(calendar.timegm(parsed), timezone.utc)
+
+
+def _element_entry(element: Any, url: str) -> Optional[EntryData]:
+    """Compact entry of an RSS item or an Atom entry, None without a link or a date"""
+    title, content, link = "", None, None
+    published, updated = None, None
+    for child in element:
+        tag = child.tag
+        if tag in TITLE_TAGS:
+            title = "".join(child.itertext())
+        elif tag in CONTENT_TAGS:
+            content = "".join(child.itertext())
+        elif tag == "link" or tag == f"{RSS1}link":
+            link = (child.text or "").strip()
+        elif tag == f"{ATOM}link":
+            if child.get("rel", "alternate") == "alternate" and link is None:
+                link = child.get("href")
+        elif tag in PUBLISHED_TAGS:
+            published = published or _timestamp(child.text)
+        elif tag in UPDATED_TAGS:
+            updated = _timestamp(child.text)
+    published = published or updated
+    if not link or published is None:
+        return None
+    return EntryData(urljoin(url, link), published, normalize_text(title, content))
+
+
+def _stream_entries(body: bytes, url: str, watermark: Optional[datetime], max_entries: int, entries: List[EntryData]) -> None:
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    previous, newest_first = None, True #the order of the entries read so far
+    for start in range(0, len(body), CHUNK_SIZE):
+        parser.feed(body[start:start + CHUNK_SIZE])
+        for event, element in parser.read_events():
+            if root is None:
+                root = element.tag
+                if root not in ROOT_TAGS:
+                    raise ValueError(f"not a feed, the root element is {root}")
+            if event != "end" or element.tag not in ENTRY_TAGS:
+                continue
+            entry = _element_entry(element, url)
+            element.clear() #only the compact entry is kept
+            if entry is None:
+                continue
+            newest_first = newest_first and (previous is None or entry.published <= previous)
+            older = previous
+            previous = entry.published
+            if watermark is not None and entry.published <= watermark:
+                if older is not None and newest_first:
+                    return #the feed is newest first, the rest has been seen already
+                continue
+            entries.append(entry)
+            if len(entries) >= max_entries:
+                return
+    parser.close()
+
+
+def _feedparser_entries(body: bytes, url: str, watermark: Optional[datetime], max_entries: int) -> List[EntryData]:
+    fp = feedparser.parse(body, response_headers={"content-location": url})
+    if fp.bozo and not fp.entries:
+        raise ValueError(f"not a feed, {fp.bozo_exception}")
+    if not fp.version:
+        raise ValueError("not a feed, unknown format")
+    entries: List[EntryData] = []
+    previous, newest_first = None, True
+    for entry in fp.entries:
+        published = entry.get("published_parsed") or entry.get("updated_parsed")
+        if published is None or "link" not in entry:
+            continue
+        timestamp = datetime.fromtimestamp(calendar.timegm(published), timezone.utc)
+        newest_first = newest_first and (previous is None or timestamp <= previous)
+        older = previous
+        previous = timestamp
+        if watermark is not None and timestamp <= watermark:
+            if older is not None and newest_first:
+                break
+            continue
+        content = entry.content[0].value if "content" in entry and entry.content else None
+        entries.append(EntryData(entry.link, timestamp, normalize_text(entry.get("title", ""), content)))
+        if len(entries) >= max_entries:
+            break
+    return entries
+
+
+def parse_entries(body: bytes, url: str, watermark: Optional[datetime] = None, max_entries: int = 200,
+                  truncated: bool = False) -> List[EntryData]:
+    """Parse the feed entry by entry, stopping at max_entries or at the first entry not newer than the watermark
+    once the entries are newest first, older entries are skipped in the other feeds.
+    The body is streamed through an XML pull parser, feedparser only handles the documents it cannot read,
+    such as feeds with HTML entities. Raises ValueError if the document is not an RSS or Atom feed"""
+    entries: List[EntryData] = []
+    try:
+        _stream_entries(body, url, watermark, max_entries, entries)
+    except ET.ParseError:
+        if truncated and entries: #a body cut at the size limit keeps the entries read before the cut
+            return entries
+        return _feedparser_entries(body, url, watermark, max_entries)
+    return entries
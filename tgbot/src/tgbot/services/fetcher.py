@@ -0,0 +1,127 @@
+import aiohttp # type: ignore
+import asyncio
+import feedparser # type: ignore
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from tgbot.models.entry import EntryData
+from tgbot.models.validator import ValidatorData
+from tgbot.services.feed_parser import parse_entries
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class FetchError(Exception):
+    """The feed could not be downloaded or is not a feed"""
+
+
+class Fetcher:
+    """Concurrent feed download layer that keeps the event loop free"""
+
+    def __init__(self, concurrency: int = 20, per_host: int = 2, timeout: float = 30, parse_workers: int = 2,
+                 max_bytes: int = 2_000_000, max_entries: int = 200):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._per_host = per_host
+        self.timeout = timeout
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=parse_workers) #parsing and other blocking calls run here
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.max_bytes = max_bytes #the rest of a larger body is cut off
+        self.max_entries = max_entries #newest entries parsed per feed
+
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self._timeout,
+                headers={"User-Agent": feedparser.USER_AGENT},
+            )
+        return self._session
+
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self._per_host)
+        return self._host_semaphores[host]
+
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call in the worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+
+    async def _read(self, url: str, response: aiohttp.ClientResponse) -> Tuple[bytes, bool]:
+        """Read the body in chunks up to max_bytes, returns it with whether the rest has been cut off"""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(65536):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                _log(f"{url} is larger than {self.max_bytes} bytes, the rest is skipped")
+                return b"".join(chunks)[:self.max_bytes], True
+        return b"".join(chunks), False
+
+
+    async def fetch(self, url: str, validator: Optional[ValidatorData] = None) -> Tuple[Optional[bytes], Optional[ValidatorData], bool]:
+        """Download the body of the url with a conditional request, returns (body, validator, truncated).
+        The body is None if the content has not changed since the validator was stored, raises FetchError if the download fails"""
+        headers = {}
+        if validator is not None:
+            if validator.etag:
+                headers["If-None-Match"] = validator.etag
+            if validator.last_modified:
+                headers["If-Modified-Since"] = validator.last_modified
+        async with self._semaphore, self._host_semaphore(url):
+            try:
+                async with self._get_session().get(url, headers=headers) as response:
+                    if response.status == 304:
+                        return None, validator, False
+                    response.raise_for_status()
+                    body, truncated = await self._read(url, response)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+            except aiohttp.ClientResponseError as e:
+                raise FetchError(f"HTTP {e.status} {e.message}") from e
+            except asyncio.TimeoutError as e:
+                raise FetchError(f"No response in {self.timeout:g}s") from e
+            except aiohttp.ClientError as e:
+                raise FetchError(repr(e)) from e
+        new_validator = ValidatorData(url, etag, last_modified, hashlib.sha256(body).hexdigest())
+        if validator is not None and validator.content_hash == new_validator.content_hash:
+            return None, new_validator._replace(watermark=validator.watermark), truncated
+        return body, new_validator, truncated
+
+
+    async def fetch_feed(self, url: str, validator: Optional[ValidatorData] = None,
+                         watermark: Optional[datetime] = None) -> Tuple[Optional[List[EntryData]], Optional[ValidatorData]]:
+        """Download the feed and parse its entries newer than the watermark in the worker pool,
+        the entries are None if the feed has not changed. The new validator remembers the watermark of the parse"""
+        body, new_validator, truncated = await self.fetch(url, validator)
+        if body is None:
+            return None, new_validator
+        try:
+            entries = await self.run_blocking(parse_entries, body, url, watermark, self.max_entries, truncated)
+        except Exception as e:
+            raise FetchError(f"Unreadable feed: {e}") from e
+        return entries, new_validator._replace(watermark=watermark)
+
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._executor.shutdown(wait=False)
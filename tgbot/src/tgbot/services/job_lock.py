@@ -0,0 +1,47 @@
+import asyncio
+import logging
+
+from typing import Awaitable, Callable
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class JobLock:
+    """Runs a job on one replica at a time with a Postgres session advisory lock.
+    The lock is held on its own connection for the length of the run, if the replica dies
+    the connection is closed and the next run starts anywhere else"""
+
+    SUBSCRIPTION = 7302
+    REAPER = 7303
+    OUTBOX = 7304
+
+    def __init__(self, pool, lock_id: int, name: str, quiet: bool = False):
+        self.pool = pool
+        self.lock_id = lock_id
+        self.name = name
+        self.quiet = quiet #the skips of the standby replicas are expected, they are not logged
+        self._running = asyncio.Lock() #overlapping runs within this process
+
+
+    async def run(self, job: Callable[[], Awaitable[None]]) -> bool:
+        """Run the job unless it is still running here or on another replica, returns whether it ran"""
+        if self._running.locked():
+            _log(f"Skipping {self.name}, the previous run has not finished")
+            return False
+        async with self._running:
+            async with self.pool.acquire() as conn:
+                if not await conn.fetchval("select pg_try_advisory_lock($1)", self.lock_id):
+                    if not self.quiet:
+                        _log(f"Skipping {self.name}, it is running on another replica")
+                    return False
+                try:
+                    await job()
+                finally:
+                    await conn.execute("select pg_advisory_unlock($1)", self.lock_id)
+        return True
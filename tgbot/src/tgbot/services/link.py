@@ -2,7 +2,9 @@ import logging
 
 from datetime import datetime, timedelta
 from tgbot.models.link import LinkData
-from typing import List
+from tgbot.services import queries
+from tgbot.services.link_cache import SentLinkCache
+from typing import Iterable, List, Optional, Set, Tuple
 
 def _log(obj) -> None:
     logging.basicConfig(
@@ -16,38 +18,71 @@ def _log(obj) -> None:
 class Link:
     """News delivery abstraction layer"""
 
-    def __init__(self, conn = None):
+    def __init__(self, conn = None, cache: Optional[SentLinkCache] = None):
         self.conn = conn
+        self.cache = cache
 
 
-    async def is_sent(self, user_id: int, link: str) -> bool:
-        result: bool = False
-        row = await self.conn.fetchrow(
-            "SELECT * FROM links WHERE user_id = $1 and article_link = $2",
-            user_id,
-            link,
+    async def warm_cache(self) -> None:
+        """Load the most recent sent links within the deletion horizon into the cache"""
+        if self.cache is None:
+            return
+        d = datetime.today() - timedelta(days=15) #to get the deletion horizon
+        rows = await queries.LIST_RECENT_LINKS.fetch(
+            self.conn,
+            d,
+            self.cache.max_size,
         )
-        if row:
-            result = True
-        return result
-
-
-    async def save_link(self, link: LinkData) -> None:
-        await self.conn.execute('''
-            insert into links (key, user_id, article_link, sent)
-            values (DEFAULT, $1, $2, $3)
-            ''',
-            int(link.user_id),
-            link.article_link,
-            link.sent,
+        for row in reversed(rows): #the most recent links end up as the most recently used
+            self.cache.add(row["user_id"], row["article_link"], row["sent"])
+
+
+    async def sent_links_bulk(self, user_links: Iterable[Tuple[int, str]]) -> Set[Tuple[int, str]]:
+        """Return the (user_id, link) pairs from the batch which have already been sent, for many users at once"""
+        user_links = list(user_links)
+        sent: Set[Tuple[int, str]] = set()
+        if self.cache is not None:
+            sent = {(user_id, link) for user_id, link in user_links if self.cache.contains(user_id, link)}
+            user_links = [user_link for user_link in user_links if user_link not in sent]
+            sent.update(await self.cache.lookup_shared(user_links))
+            user_links = [user_link for user_link in user_links if user_link not in sent]
+        if not user_links:
+            return sent
+        rows = await queries.SENT_LINKS_BULK.fetch(
+            self.conn,
+            [int(user_id) for user_id, _ in user_links],
+            [article_link for _, article_link in user_links],
+        )
+        for row in rows:
+            sent.add((row["user_id"], row["article_link"]))
+            if self.cache is not None:
+                self.cache.add(row["user_id"], row["article_link"], row["sent"])
+        return sent
+
+
+    async def save_links(self, links: List[LinkData]) -> None:
+        """Save a batch of sent links in one round-trip"""
+        if not links:
+            return
+        await queries.SAVE_LINK.executemany(
+            self.conn,
+            [(int(link.user_id), link.article_link, link.sent) for link in links],
             )
+        if self.cache is not None:
+            for link in links:
+                self.cache.add(link.user_id, link.article_link, link.sent)
+            await self.cache.publish([(link.user_id, link.article_link, link.sent) for link in links])
         return
 
 
-    async def clear_old_link(self) -> None:
+    async def clear_old_link(self, batch_size: int = 1000) -> int:
+        """Delete one bounded batch of links older than the horizon, returns the number of deleted links"""
         d = datetime.today() - timedelta(days=15) #to get the deletion horizon
-        await self.conn.execute(
-            "delete from links where sent < $1",
+        status = await queries.CLEAR_OLD_LINKS.execute(
+            self.conn,
             d,
+            batch_size,
             )
-        return
\ No newline at end of file
+        if self.cache is not None:
+            self.cache.expire()
+        return int(status.split()[-1])
\ No newline at end of file
@@ -0,0 +1,89 @@
+import time
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from tgbot.services.shared_cache import sent_key
+from typing import Any, List, Optional, Set, Tuple
+
+
+class SentLinkCache:
+    """Process-local LRU set of the links already sent, kept in front of the links table.
+    Only 8-byte hashes of (user, link) are kept, so the memory budget is fixed by max_size.
+    With a shared tier the links sent by the other processes are looked up there before the database"""
+
+    def __init__(self, max_size: int = 100000, ttl: timedelta = timedelta(days=15), shared: Optional[Any] = None):
+        self.max_size = max_size
+        self.shared = shared
+        self.ttl = ttl.total_seconds() #matches the Link.clear_old_link horizon
+        self._entries: "OrderedDict[int, float]" = OrderedDict() #hash -> sent timestamp
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    @staticmethod
+    def _key(user_id: int, link: str) -> int:
+        digest = blake2b(f"{int(user_id)}:{link}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+
+    def add(self, user_id: int, link: str, sent: datetime) -> None:
+        key = self._key(user_id, link)
+        self._entries[key] = sent.timestamp()
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+    def contains(self, user_id: int, link: str) -> bool:
+        key = self._key(user_id, link)
+        sent = self._entries.get(key)
+        if sent is None:
+            self.misses += 1
+            return False
+        if sent < time.time() - self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return False
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True
+
+
+    async def lookup_shared(self, user_links: List[Tuple[int, str]]) -> Set[Tuple[int, str]]:
+        """The (user_id, link) pairs known as sent in the shared tier, they are added to the local cache"""
+        if self.shared is None or not user_links:
+            return set()
+        found = await self.shared.has_scored([sent_key(user_id, link) for user_id, link in user_links], time.time() - self.ttl)
+        now = datetime.now()
+        sent = {user_link for user_link, is_sent in zip(user_links, found) if is_sent}
+        for user_id, link in sent:
+            self.add(user_id, link, now)
+        return sent
+
+
+    async def publish(self, user_links: List[Tuple[int, str, datetime]]) -> None:
+        """Share the sent (user_id, link, sent) with the other processes"""
+        if self.shared is None or not user_links:
+            return
+        await self.shared.add_scored(
+            [(*sent_key(user_id, link), sent.timestamp()) for user_id, link, sent in user_links],
+            time.time() - self.ttl,
+            )
+
+
+    def expire(self) -> None:
+        """Drop the entries older than the deletion horizon"""
+        horizon = time.time() - self.ttl
+        for key in [key for key, sent in self._entries.items() if sent < horizon]:
+            del self._entries[key]
+
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"Sent link cache: {len(self._entries)}/{self.max_size} entries, hit rate {hit_rate:.1%} ({self.hits}/{lookups})"
@@ -0,0 +1,94 @@
+from collections import deque
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Mapping, Optional, Set, Tuple
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton over the keywords of many subscribers.
+    The text is scanned once and the result is the set of subscribers having a keyword in it"""
+
+    def __init__(self, keywords: Mapping[Hashable, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[Hashable]] = [set()]
+        for subscriber, subscriber_keywords in keywords.items():
+            for keyword in subscriber_keywords:
+                if keyword:
+                    self._add(keyword, subscriber)
+        self._build()
+
+
+    def _add(self, keyword: str, subscriber: Hashable) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(subscriber)
+
+
+    def _build(self) -> None:
+        """Compute the failure links breadth first and merge the outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+
+    def match(self, text: str) -> Set[Hashable]:
+        """Return the subscribers having at least one keyword in the normalized text"""
+        result: Set[Hashable] = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                result |= output[state]
+        return result
+
+
+def normalize_text(title: str, content: Optional[str]) -> str:
+    """Normalize the title and the content of a feed entry once for matching"""
+    text = title
+    if content:
+        text = f"{text}\0{content}" #the separator keeps keywords from matching across title and content
+    return text.lower()
+
+
+class MatcherCache:
+    """Compiled matchers per feed link, rebuilt only when the subscribers' keywords change"""
+
+    def __init__(self):
+        self._matchers: Dict[str, Tuple[FrozenSet, KeywordMatcher]] = {}
+
+
+    def get(self, feed_link: str, keywords: Mapping[Hashable, Iterable[str]]) -> KeywordMatcher:
+        signature = frozenset((subscriber, frozenset(subscriber_keywords)) for subscriber, subscriber_keywords in keywords.items())
+        cached = self._matchers.get(feed_link)
+        if cached is None or cached[0] != signature:
+            cached = (signature, KeywordMatcher(keywords))
+            self._matchers[feed_link] = cached
+        return cached[1]
+
+
+    def retain(self, feed_links: Iterable[str]) -> None:
+        """Forget the matchers of the feeds nobody follows anymore"""
+        feed_links = set(feed_links)
+        for feed_link in [feed_link for feed_link in self._matchers if feed_link not in feed_links]:
+            del self._matchers[feed_link]
+
+
+    def __len__(self) -> int:
+        return len(self._matchers)
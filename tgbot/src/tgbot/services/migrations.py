@@ -0,0 +1,124 @@
+import logging
+
+from typing import List, Tuple
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+# (version, name, sql), append only: an applied migration is never changed
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "base tables", '''
+        create table if not exists users (
+            id bigint primary key,
+            frequency integer not null default 21600,
+            feed_active boolean not null default false,
+            last_sent timestamptz
+        );
+        create table if not exists feeds (
+            key serial primary key,
+            user_id bigint not null,
+            feed_link text not null,
+            feed_type text not null,
+            search_string text not null default '',
+            last_updated timestamptz not null
+        );
+        create table if not exists links (
+            key bigserial primary key,
+            user_id bigint not null,
+            article_link text not null,
+            sent timestamptz not null
+        );
+    '''),
+    (2, "feed validators and outbox", '''
+        create table if not exists feed_validators (
+            feed_link text primary key,
+            etag text,
+            last_modified text,
+            content_hash text not null,
+            checked timestamptz not null
+        );
+        create table if not exists outbox (
+            key bigserial primary key,
+            user_id bigint not null,
+            article_link text not null,
+            feed_link text not null,
+            created timestamptz not null,
+            attempts integer not null default 0,
+            next_attempt timestamptz not null,
+            unique (user_id, article_link)
+        );
+    '''),
+    (3, "indexes for the hot queries", '''
+        delete from links a using links b
+        where a.user_id = b.user_id and a.article_link = b.article_link and a.key < b.key;
+        create unique index if not exists links_user_article_idx on links (user_id, article_link);
+        create index if not exists links_sent_idx on links (sent);
+        create index if not exists feeds_user_link_idx on feeds (user_id, feed_link);
+        create index if not exists feeds_user_type_key_idx on feeds (user_id, feed_type, key);
+        create index if not exists feeds_type_link_idx on feeds (feed_type, feed_link);
+        create index if not exists users_active_idx on users (id) where feed_active;
+        create index if not exists outbox_next_attempt_idx on outbox (next_attempt);
+    '''),
+    (4, "feed leases", '''
+        create table if not exists feed_leases (
+            feed_link text primary key,
+            owner text not null,
+            expires timestamptz not null
+        );
+    '''),
+    (5, "feed health", '''
+        create table if not exists feed_health (
+            feed_link text primary key,
+            failures integer not null,
+            last_error text not null,
+            last_failure timestamptz not null,
+            open_until timestamptz
+        );
+    '''),
+    (6, "feed validator watermarks", '''
+        alter table feed_validators add column if not exists watermark timestamptz;
+    '''),
+    (7, "user due times", '''
+        alter table users add column if not exists next_due timestamptz;
+    '''),
+]
+
+
+class Migrations:
+    """Idempotent schema migrations applied on startup"""
+
+    LOCK_ID = 7301 #advisory lock taken while migrating, so several processes can start at once
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+    async def run(self) -> None:
+        async with self.conn.transaction():
+            await self.conn.execute("select pg_advisory_xact_lock($1)", self.LOCK_ID)
+            await self.conn.execute('''
+                create table if not exists schema_migrations (
+                    version integer primary key,
+                    name text not null,
+                    applied timestamptz not null default now()
+                )
+                ''')
+            rows = await self.conn.fetch("select version from schema_migrations")
+            applied = {row["version"] for row in rows}
+            for version, name, sql in MIGRATIONS:
+                if version in applied:
+                    continue
+                _log(f"Applying migration {version}: {name}")
+                await self.conn.execute(sql)
+                await self.conn.execute(
+                    "insert into schema_migrations (version, name) values ($1, $2)",
+                    version,
+                    name,
+                    )
+        return
@@ -0,0 +1,87 @@
+import logging
+
+from datetime import datetime, timedelta, timezone
+from tgbot.models.link import LinkData
+from tgbot.models.outbox import OutboxData
+from tgbot.services import queries
+from tgbot.services.link import Link
+from tgbot.services.link_cache import SentLinkCache
+from typing import List, Optional, Set, Tuple
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class Outbox:
+    """Durable queue of the matched links waiting for delivery"""
+
+    def __init__(self, conn = None):
+        self.conn = conn
+
+
+    async def enqueue(self, items: List[OutboxData]) -> Set[Tuple[int, str]]:
+        """Store the items for delivery at their due time in one statement.
+        The items already queued or sent are skipped, returns the (user_id, link) pairs actually queued"""
+        if not items:
+            return set()
+        rows = await queries.ENQUEUE_OUTBOX.fetch(
+            self.conn,
+            [int(item.user_id) for item in items],
+            [item.article_link for item in items],
+            [item.feed_link for item in items],
+            [item.created for item in items],
+            [item.due for item in items],
+            )
+        return {(row["user_id"], row["article_link"]) for row in rows}
+
+
+    async def claim(self, limit: int, lease: timedelta) -> List[OutboxData]:
+        """Take the due items for delivery. They are hidden from other claims for the lease time,
+        so the items of a crashed delivery are retried after the lease"""
+        now = datetime.now(timezone.utc)
+        rows = await queries.CLAIM_OUTBOX.fetch(
+            self.conn,
+            now,
+            now + lease,
+            limit,
+        )
+        return [
+            OutboxData(row["key"], row["user_id"], row["article_link"], row["feed_link"], row["created"], row["next_attempt"])
+            for row in sorted(rows, key=lambda row: row["key"])
+            ]
+
+
+    async def complete(self, items: List[OutboxData], link_cache: Optional[SentLinkCache] = None) -> None:
+        """Record the delivered items as sent links and remove them from the outbox"""
+        if not items:
+            return
+        now = datetime.now(timezone.utc)
+        async with self.conn.transaction():
+            await Link(self.conn, link_cache).save_links([LinkData(item.user_id, item.article_link, now) for item in items])
+            await self.drop(items)
+        return
+
+
+    async def drop(self, items: List[OutboxData]) -> None:
+        await queries.DROP_OUTBOX.execute(
+            self.conn,
+            [item.key for item in items],
+            )
+        return
+
+
+    async def drop_exhausted(self, max_attempts: int) -> int:
+        """Give up the items which have failed too many times"""
+        rows = await queries.DROP_EXHAUSTED_OUTBOX.fetch(
+            self.conn,
+            max_attempts,
+            datetime.now(timezone.utc),
+            )
+        for row in rows:
+            _log(f"Giving up delivery of {row['article_link']} to {row['user_id']}")
+        return len(rows)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+from datetime import datetime, timedelta, timezone
+from tgbot.models.outbox import OutboxData
+from tgbot.services.delivery import Delivery
+from tgbot.services.link_cache import SentLinkCache
+from tgbot.services.outbox import Outbox
+from tgbot.services.repository import Repo
+from typing import Dict, List
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class OutboxWorker:
+    """Background task draining the outbox through the bot, independently of the fetch cycle"""
+
+    def __init__(self, pool, delivery: Delivery, link_cache: SentLinkCache, batch_size: int = 100,
+                 interval: float = 10, lease: float = 300, max_attempts: int = 5):
+        self.pool = pool
+        self.delivery = delivery
+        self.link_cache = link_cache
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = timedelta(seconds=lease)
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+
+
+    def wake(self) -> None:
+        """Start draining without waiting for the interval, e.g. after new items were queued.
+        Only the delivering process is woken, the items queued elsewhere wait for its next round"""
+        self._wakeup.set()
+
+
+    async def run(self) -> None:
+        while True:
+            try:
+                while await self.drain():
+                    pass
+            except Exception as e:
+                _log(f"Outbox delivery has failed: {e!r}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+    async def drain(self) -> int:
+        """Deliver one batch of due items, returns the number of claimed items"""
+        async with self.pool.acquire() as conn:
+            outbox = Outbox(conn)
+            await outbox.drop_exhausted(self.max_attempts)
+            items = await outbox.claim(self.batch_size, self.lease)
+        if not items:
+            return 0
+        by_user: Dict[int, List[OutboxData]] = {}
+        for item in items:
+            by_user.setdefault(item.user_id, []).append(item)
+        results = await asyncio.gather(*(
+            self.delivery.send(user_id, [item.article_link for item in user_items])
+            for user_id, user_items in by_user.items()
+            ))
+        delivered = [
+            item
+            for user_items, user_delivered in zip(by_user.values(), results)
+            for item in user_items
+            if item.article_link in user_delivered
+            ]
+        now = datetime.now(timezone.utc)
+        async with self.pool.acquire() as conn:
+            await Outbox(conn).complete(delivered, self.link_cache)
+            repo = Repo(conn)
+            for user_id in {item.user_id for item in delivered}:
+                await repo.set_last_sent(user_id, now)
+        #the undelivered items stay claimed until the lease expires and are retried then
+        return len(items)
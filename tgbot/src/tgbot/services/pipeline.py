@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import time
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from tgbot.models.entry import EntryData
+from tgbot.models.feed import FeedData
+from tgbot.models.health import HealthData
+from tgbot.models.outbox import OutboxData
+from tgbot.models.validator import ValidatorData
+from tgbot.services.feed import Feed
+from tgbot.services.fetcher import FetchError, Fetcher
+from tgbot.services.link import Link
+from tgbot.services.link_cache import SentLinkCache
+from tgbot.services.matcher import MatcherCache
+from tgbot.services.outbox import Outbox
+from tgbot.services.outbox_worker import OutboxWorker
+from tgbot.services.queries import query_stats
+from tgbot.services.repository import Repo
+from tgbot.services.schedule import FeedSchedule
+from tgbot.services.search import SearchPlanner
+from tgbot.services.validator import ValidatorCache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+@dataclass
+class FeedBatch:
+    """One feed link with all its subscribers, passed from stage to stage"""
+    feed_link: str
+    feed_type: str
+    feeds: List[FeedData]
+    parsed: Optional[List[EntryData]] = None #compact entries newer than the feed watermark
+    validator: Optional[ValidatorData] = None
+    candidates: Dict[Tuple[int, str], str] = field(default_factory=dict) #(user, article link) -> feed link
+    watermarks: Dict[int, datetime] = field(default_factory=dict) #user -> newest entry timestamp seen
+
+
+class SubscriptionPipeline:
+    """Subscription cycle as concurrent stages connected by bounded queues:
+    fetch -> match -> dedupe -> persist.
+    Every stage has its own workers and takes its own connections from the pool.
+    New links are persisted into the outbox, the outbox worker delivers them"""
+
+    def __init__(self, pool, outbox_worker: OutboxWorker, fetcher: Fetcher, planner: SearchPlanner, link_cache: SentLinkCache,
+                 matchers: MatcherCache, polls: FeedSchedule, refresh: float = 900, queue_size: int = 100, page_size: int = 100, fetch_workers: int = 20, match_workers: int = 2,
+                 dedupe_workers: int = 4, persist_workers: int = 2, owner: Optional[str] = None, feed_lease: float = 240,
+                 shared: Optional[Any] = None, validator_ttl: float = 86400,
+                 failure_threshold: int = 3, cooldown: float = 600, max_cooldown: float = 86400):
+        self.pool = pool
+        self.outbox_worker = outbox_worker
+        self.fetcher = fetcher
+        self.planner = planner
+        self.link_cache = link_cache
+        self.matchers = matchers
+        self.polls = polls #feeds are fetched for the due users only once their own poll time has come
+        self.refresh = refresh #seconds between cleanups of the matchers and poll times of the feeds nobody follows
+        self._refreshed_at = 0.0
+        self.feed = Feed()
+        self.queue_size = queue_size
+        self.page_size = page_size #feeds read from the database at a time
+        self.owner = owner #with an owner every feed is claimed first, so each one is processed by one worker only
+        self.feed_lease = timedelta(seconds=feed_lease)
+        self.shared = shared #with a shared tier the validators are read by all the workers
+        self.validator_ttl = validator_ttl
+        self.failure_threshold = failure_threshold #failures in a row before the circuit of a feed is opened
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.stages: List[Tuple[Callable[[FeedBatch], Awaitable[Optional[FeedBatch]]], int]] = [
+            (self._fetch, fetch_workers),
+            (self._match, match_workers),
+            (self._dedupe, dedupe_workers),
+            (self._persist, persist_workers),
+        ]
+        self._seen: Set[Tuple[int, str]] = set()
+        self._queued = 0
+        self._skipped = 0
+        self._broken = 0
+        self._failing: Dict[str, HealthData] = {}
+        self._due_users: Set[int] = set()
+        self._watermarks: Dict[Tuple[int, str], datetime] = {}
+
+
+    async def run(self) -> None:
+        """Run one subscription cycle for the users who are due and wait until every stage has drained.
+        The feeds of the due users are matched for all their subscribers, the links of the users
+        who are not due yet wait in the outbox for their next digest.
+        The due users are claimed in Postgres, so each of them is taken by one replica only"""
+        self._seen = set()
+        self._queued = 0
+        self._skipped = 0
+        self._broken = 0
+        self._watermarks = {}
+        await self._refresh_feeds()
+        async with self.pool.acquire() as conn:
+            due_users = await Repo(conn).claim_due_users(datetime.now(timezone.utc))
+        if not due_users:
+            return
+        self._due_users = set(due_users)
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        workers = []
+        for index, (handle, count) in enumerate(self.stages):
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            workers.extend(
+                asyncio.create_task(self._worker(handle, queues[index], outbox))
+                for _ in range(count)
+                )
+        feeds = 0
+        try:
+            async with self.pool.acquire() as conn:
+                self._failing = await Feed(conn).list_failing_feeds()
+            async for batch in self._source(due_users):
+                await queues[0].put(batch) #waits while the fetch stage is busy, the rest is still in the cursor
+                feeds += 1
+            for queue in queues:
+                await queue.join()
+            await self._flush_watermarks()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        _log(f"Subscription cycle: {len(due_users)} users due, {feeds} feeds, "
+             f"{self._skipped} feeds not due, {self._broken} feeds paused after failures, {self._queued} items queued")
+        _log(self.link_cache.stats())
+        _log(query_stats())
+        _log(self.planner.stats())
+
+
+    async def next_run(self, max_wait: float) -> float:
+        """Seconds until the next user is due, at most max_wait so the users changed meanwhile are seen in time"""
+        async with self.pool.acquire() as conn:
+            next_due = await Repo(conn).next_due()
+        if next_due is None:
+            return max_wait
+        return min(max(next_due.timestamp() - time.time(), 1), max_wait)
+
+
+    async def _worker(self, handle, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]) -> None:
+        while True:
+            batch = await inbox.get()
+            try:
+                result = await handle(batch)
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+            except Exception as e:
+                _log(f"Failed to process {batch.feed_link} in {handle.__name__}: {e!r}")
+            finally:
+                inbox.task_done()
+
+
+    async def _refresh_feeds(self) -> None:
+        if time.time() - self._refreshed_at < self.refresh:
+            return
+        self._refreshed_at = time.time()
+        async with self.pool.acquire() as conn:
+            rss_links = await Feed(conn).list_active_feed_links("rss")
+            self.matchers.retain(rss_links)
+            self.polls.retain(rss_links + await Feed(conn).list_active_feed_links("html"))
+
+
+    async def _flush_watermarks(self) -> None:
+        """Store last_updated of all the feeds processed during the cycle with one update"""
+        async with self.pool.acquire() as conn:
+            await Feed(conn).update_last_updated_bulk(self._watermarks)
+        self._watermarks = {}
+
+
+    async def _source(self, user_ids: List[int]) -> AsyncIterator[FeedBatch]:
+        """Stream the subscriptions of the due feeds followed by the users grouped by feed link.
+        They are read page by page with short queries, no connection or transaction is held while the stages are busy"""
+        now = time.time()
+        after = ("", "")
+        while True:
+            async with self.pool.acquire() as conn:
+                page = await Feed(conn).list_active_subscriptions(user_ids, after, self.page_size)
+            for feed_type, feed_link, feeds in page:
+                if not self.polls.is_due(feed_link, now):
+                    self._skipped += 1
+                    continue
+                health = self._failing.get(feed_link)
+                if health is not None and health.open_until is not None and health.open_until.timestamp() > now:
+                    self._broken += 1 #the circuit is open, the feed is tried again after the cooldown
+                    continue
+                yield FeedBatch(feed_link, feed_type, feeds)
+            if len(page) < self.page_size:
+                return
+            after = (page[-1][0], page[-1][1])
+
+
+    async def _fetch(self, batch: FeedBatch) -> Optional[FeedBatch]:
+        if self.owner is not None:
+            async with self.pool.acquire() as conn:
+                if not await Feed(conn).claim_feed(batch.feed_link, self.owner, self.feed_lease):
+                    return None #another worker has it in this cycle
+        if batch.feed_type == "html":
+            searched = datetime.now(timezone.utc) #search results have no timestamps
+            batch.candidates = await self.feed.search_google_items(batch.feeds, self.planner)
+            batch.watermarks = {user_id: searched for user_id, _ in batch.candidates.keys()}
+            self.polls.record_search(batch.feed_link, time.time())
+            return batch
+        async with self.pool.acquire() as conn:
+            validators = await ValidatorCache(conn, self.shared, self.validator_ttl).get_validators([batch.feed_link])
+        old_validator = validators.get(batch.feed_link)
+        # unchanged feeds (304 or the same content hash) are neither downloaded in full nor parsed
+        watermark = min(feed.last_updated for feed in batch.feeds) #entries older than every subscriber's are not parsed
+        if old_validator is not None and (old_validator.watermark is None or watermark < old_validator.watermark):
+            send_validator = None #a new subscriber or a changed search rescans the entries the last parse skipped
+        else:
+            send_validator = old_validator
+        try:
+            batch.parsed, batch.validator = await self.fetcher.fetch_feed(batch.feed_link, send_validator, watermark)
+        except FetchError as e:
+            await self._record_failure(batch.feed_link, str(e))
+            return None
+        self.polls.record(batch.feed_link, [entry.published for entry in batch.parsed or []], False, time.time())
+        if self._failing.pop(batch.feed_link, None) is not None:
+            async with self.pool.acquire() as conn:
+                await Feed(conn).clear_health(batch.feed_link)
+            _log(f"{batch.feed_link} works again")
+        if batch.validator == old_validator:
+            batch.validator = None #nothing to store
+        if batch.parsed is None and batch.validator is None:
+            return None
+        return batch
+
+
+    async def _record_failure(self, feed_link: str, error: str) -> None:
+        self.polls.record(feed_link, [], True, time.time())
+        async with self.pool.acquire() as conn:
+            health = await Feed(conn).record_failure(feed_link, error, self.failure_threshold, self.cooldown, self.max_cooldown)
+        self._failing[feed_link] = health
+        paused = f", paused until {health.open_until:%Y-%m-%d %H:%M} UTC" if health.open_until is not None else ""
+        _log(f"Failed to fetch {feed_link} ({health.failures} in a row{paused}): {error}")
+
+
+    async def _match(self, batch: FeedBatch) -> Optional[FeedBatch]:
+        if batch.parsed is not None:
+            batch.candidates = self.feed.match_rss_items(batch.feeds, batch.parsed, self.matchers, batch.watermarks)
+            batch.parsed = None #the entries are not needed anymore
+        return batch
+
+
+    async def _dedupe(self, batch: FeedBatch) -> Optional[FeedBatch]:
+        #drop the links found in another feed during this cycle before awaiting the database
+        candidates = {key: feed_link for key, feed_link in batch.candidates.items() if key not in self._seen}
+        self._seen.update(candidates.keys())
+        if candidates:
+            async with self.pool.acquire() as conn:
+                sent = await Link(conn, self.link_cache).sent_links_bulk(candidates.keys())
+            candidates = {key: feed_link for key, feed_link in candidates.items() if key not in sent}
+        batch.candidates = candidates
+        return batch
+
+
+    async def _persist(self, batch: FeedBatch) -> Optional[FeedBatch]:
+        now = datetime.now(timezone.utc)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                queued = await Outbox(conn).enqueue([
+                    OutboxData(None, user_id, article_link, feed_link, now, now if user_id in self._due_users else None)
+                    for (user_id, article_link), feed_link in batch.candidates.items()
+                    ])
+                if batch.validator is not None:
+                    await ValidatorCache(conn, self.shared, self.validator_ttl).save_validators([batch.validator])
+        for user_id, article_link in batch.candidates.keys():
+            self.link_cache.add(user_id, article_link, now) #queued links are not matched again
+        for user_id, timestamp in batch.watermarks.items():
+            key = (user_id, batch.feed_link)
+            if key not in self._watermarks or timestamp > self._watermarks[key]:
+                self._watermarks[key] = timestamp #flushed once at the end of the cycle
+        if queued:
+            self._queued += len(queued)
+            self.outbox_worker.wake()
+        return None
@@ -0,0 +1,218 @@
+import time
+
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class Query:
+    """One named SQL statement of the registry.
+    The text is fixed, so asyncpg prepares it once per connection and reuses it from the statement cache.
+    Calls and the time spent in them are counted per query"""
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = " ".join(sql.split())
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def _record(self, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+    async def execute(self, conn, *args) -> str:
+        started = time.perf_counter()
+        try:
+            return await conn.execute(self.sql, *args)
+        finally:
+            self._record(started)
+
+
+    async def executemany(self, conn, args: Iterable) -> None:
+        started = time.perf_counter()
+        try:
+            await conn.executemany(self.sql, args)
+        finally:
+            self._record(started)
+
+
+    async def fetch(self, conn, *args) -> List:
+        started = time.perf_counter()
+        try:
+            return await conn.fetch(self.sql, *args)
+        finally:
+            self._record(started)
+
+
+    async def fetchrow(self, conn, *args) -> Optional[Any]:
+        started = time.perf_counter()
+        try:
+            return await conn.fetchrow(self.sql, *args)
+        finally:
+            self._record(started)
+
+
+QUERIES: Dict[str, Query] = {}
+
+
+def _query(name: str, sql: str) -> Query:
+    query = Query(name, sql)
+    QUERIES[name] = query
+    return query
+
+
+def query_stats(limit: int = 5) -> str:
+    """The queries taking the most time so far"""
+    queries = sorted(QUERIES.values(), key=lambda query: query.total, reverse=True)[:limit]
+    return "Queries: " + ", ".join(
+        f"{query.name} {query.calls} calls avg {query.total / query.calls * 1000:.1f}ms max {query.max * 1000:.1f}ms"
+        for query in queries
+        if query.calls
+        )
+
+
+# users
+ADD_USER = _query("add_user",
+    "INSERT INTO users(id, frequency, feed_active, last_sent) VALUES ($1, 21600, false, $2) ON CONFLICT DO NOTHING")
+LIST_ACTIVE_USERS = _query("list_active_users",
+    "select id from users where feed_active = true")
+CLAIM_DUE_USERS = _query("claim_due_users", '''
+    update users u set next_due = $1::timestamptz + make_interval(secs => u.frequency)
+    from (
+        select id from users
+        where feed_active = true and coalesce(next_due, last_sent + make_interval(secs => frequency), '-infinity') <= $1::timestamptz
+        for update skip locked
+    ) due
+    where u.id = due.id
+    returning u.id
+    ''')
+NEXT_DUE = _query("next_due",
+    "select min(coalesce(next_due, last_sent + make_interval(secs => frequency), now())) as next_due from users where feed_active = true")
+GET_LAST_SENT = _query("get_last_sent",
+    "SELECT last_sent FROM users WHERE id = $1")
+SET_LAST_SENT = _query("set_last_sent",
+    "update users set last_sent=$1 where id=$2")
+SET_ACTIVE = _query("set_active",
+    "update users set feed_active=$1 where id=$2")
+
+# feeds
+LIST_FEEDS_AFTER = _query("list_feeds_after", '''
+    SELECT key, user_id, feed_link, feed_type, search_string, last_updated FROM feeds
+    WHERE user_id = $1 and feed_type = ANY($2::text[]) and key > $3 order by key asc limit $4
+    ''')
+LIST_FEEDS_BEFORE = _query("list_feeds_before", '''
+    SELECT key, user_id, feed_link, feed_type, search_string, last_updated FROM feeds
+    WHERE user_id = $1 and feed_type = ANY($2::text[]) and key < $3 order by key desc limit $4
+    ''')
+COUNT_FEEDS_BEFORE = _query("count_feeds_before", '''
+    SELECT count(*) AS feeds_before FROM feeds
+    WHERE user_id = $1 and feed_type = ANY($2::text[]) and key < $3
+    ''')
+LIST_ACTIVE_SUBSCRIPTIONS = _query("list_active_subscriptions", '''
+    WITH page AS (
+        SELECT DISTINCT f.feed_type, f.feed_link FROM feeds f JOIN users u ON u.id = f.user_id
+        WHERE u.feed_active = true and (f.feed_type, f.feed_link) > ($2, $3)
+        and ($1::bigint[] IS NULL or f.feed_link IN (SELECT feed_link FROM feeds WHERE user_id = ANY($1::bigint[])))
+        order by f.feed_type, f.feed_link limit $4
+    )
+    SELECT f.key, f.user_id, f.feed_link, f.feed_type, f.search_string, f.last_updated
+    FROM feeds f JOIN users u ON u.id = f.user_id JOIN page p ON p.feed_type = f.feed_type and p.feed_link = f.feed_link
+    WHERE u.feed_active = true
+    order by f.feed_type, f.feed_link, f.key
+    ''')
+LIST_ACTIVE_FEED_LINKS = _query("list_active_feed_links",
+    "SELECT DISTINCT f.feed_link FROM feeds f JOIN users u ON u.id = f.user_id WHERE u.feed_active = true and f.feed_type = $1")
+FEED_EXISTS = _query("feed_exists",
+    "SELECT feed_link FROM feeds WHERE user_id = $1 and feed_link = $2 order by key asc")
+CREATE_FEED = _query("create_feed", '''
+    insert into feeds (user_id, key, feed_link, feed_type, search_string, last_updated)
+    values ($1, DEFAULT, $2, $3, $4, $5)
+    ''')
+DELETE_FEED = _query("delete_feed",
+    "delete from feeds where user_id=$1 and feed_link=$2")
+UPDATE_SEARCH = _query("update_search",
+    "update feeds set search_string=$1, last_updated=$2 where user_id=$3 and feed_link=$4")
+UPDATE_LAST_UPDATED_BULK = _query("update_last_updated_bulk", '''
+    update feeds f set last_updated = w.last_updated
+    from unnest($1::bigint[], $2::text[], $3::timestamptz[]) as w(user_id, feed_link, last_updated)
+    where f.user_id = w.user_id and f.feed_link = w.feed_link and f.last_updated < w.last_updated
+    ''')
+
+# links
+LIST_RECENT_LINKS = _query("list_recent_links",
+    "SELECT user_id, article_link, sent FROM links WHERE sent >= $1 order by sent desc limit $2")
+SENT_LINKS_BULK = _query("sent_links_bulk", '''
+    SELECT l.user_id, l.article_link, l.sent FROM links l
+    JOIN unnest($1::bigint[], $2::text[]) AS c(user_id, article_link)
+    ON l.user_id = c.user_id and l.article_link = c.article_link
+    ''')
+SAVE_LINK = _query("save_link", '''
+    insert into links (key, user_id, article_link, sent)
+    values (DEFAULT, $1, $2, $3)
+    on conflict (user_id, article_link) do nothing
+    ''')
+CLEAR_OLD_LINKS = _query("clear_old_links",
+    "delete from links where key in (select key from links where sent < $1 order by sent limit $2)")
+
+# feed validators
+GET_VALIDATORS = _query("get_validators",
+    "SELECT feed_link, etag, last_modified, content_hash, watermark FROM feed_validators WHERE feed_link = ANY($1::text[])")
+SAVE_VALIDATOR = _query("save_validator", '''
+    insert into feed_validators (feed_link, etag, last_modified, content_hash, watermark, checked)
+    values ($1, $2, $3, $4, $5, $6)
+    on conflict (feed_link) do update
+    set etag = excluded.etag, last_modified = excluded.last_modified,
+        content_hash = excluded.content_hash, watermark = excluded.watermark, checked = excluded.checked
+    ''')
+
+# feed leases
+CLAIM_FEED = _query("claim_feed", '''
+    insert into feed_leases (feed_link, owner, expires) values ($1, $2, $3)
+    on conflict (feed_link) do update set owner = excluded.owner, expires = excluded.expires
+    where feed_leases.expires <= now() or feed_leases.owner = excluded.owner
+    returning feed_link
+    ''')
+
+# feed health
+LIST_FAILING_FEEDS = _query("list_failing_feeds",
+    "SELECT feed_link, failures, last_error, last_failure, open_until FROM feed_health")
+GET_FEED_HEALTH = _query("get_feed_health",
+    "SELECT feed_link, failures, last_error, last_failure, open_until FROM feed_health WHERE feed_link = ANY($1::text[])")
+RECORD_FEED_FAILURE = _query("record_feed_failure", '''
+    insert into feed_health as h (feed_link, failures, last_error, last_failure) values ($1, 1, $2, $3)
+    on conflict (feed_link) do update set failures = h.failures + 1, last_error = excluded.last_error, last_failure = excluded.last_failure
+    returning feed_link, failures, last_error, last_failure, open_until
+    ''')
+OPEN_FEED_CIRCUIT = _query("open_feed_circuit",
+    "update feed_health set open_until = $2 where feed_link = $1")
+CLEAR_FEED_HEALTH = _query("clear_feed_health",
+    "delete from feed_health where feed_link = $1")
+
+# outbox
+ENQUEUE_OUTBOX = _query("enqueue_outbox", '''
+    insert into outbox (user_id, article_link, feed_link, created, next_attempt)
+    select c.user_id, c.article_link, c.feed_link, c.created,
+        coalesce(c.due, u.next_due, u.last_sent + make_interval(secs => u.frequency), c.created)
+    from unnest($1::bigint[], $2::text[], $3::text[], $4::timestamptz[], $5::timestamptz[])
+        as c(user_id, article_link, feed_link, created, due)
+    left join users u on u.id = c.user_id
+    where not exists (select 1 from links l where l.user_id = c.user_id and l.article_link = c.article_link)
+    on conflict (user_id, article_link) do nothing
+    returning user_id, article_link
+    ''')
+CLAIM_OUTBOX = _query("claim_outbox", '''
+    update outbox set attempts = attempts + 1, next_attempt = $2
+    where key in (
+        select key from outbox where next_attempt <= $1
+        order by key limit $3
+        for update skip locked
+    )
+    returning key, user_id, article_link, feed_link, created, next_attempt
+    ''')
+DROP_OUTBOX = _query("drop_outbox",
+    "delete from outbox where key = ANY($1::bigint[])")
+DROP_EXHAUSTED_OUTBOX = _query("drop_exhausted_outbox",
+    "delete from outbox where attempts >= $1 and next_attempt <= $2 returning user_id, article_link")
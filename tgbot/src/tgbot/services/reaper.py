@@ -0,0 +1,36 @@
+import asyncio
+import logging
+
+from tgbot.services.link import Link
+from tgbot.services.link_cache import SentLinkCache
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class LinkReaper:
+    """Deletes the expired links in small batches, away from the subscription cycle"""
+
+    def __init__(self, pool, link_cache: SentLinkCache, batch_size: int = 1000, pause: float = 1.0):
+        self.pool = pool
+        self.link_cache = link_cache
+        self.batch_size = batch_size
+        self.pause = pause #seconds between batches to let vacuum and other queries keep up
+
+
+    async def run(self) -> None:
+        total = 0
+        while True:
+            async with self.pool.acquire() as conn:
+                deleted = await Link(conn, self.link_cache).clear_old_link(self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        if total:
+            _log(f"Deleted {total} expired links")
@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, timezone
-from typing import List
+from tgbot.services import queries
+from typing import List, Optional
 
 
 def _log(obj) -> None:
@@ -20,8 +21,8 @@ class Repo:
     # users
     async def add_user(self, user_id) -> None:
         """Store user in DB, ignore duplicates"""
-        await self.conn.execute(
-            "INSERT INTO users(id, frequency, feed_active, last_sent) VALUES ($1, 21600, false, $2) ON CONFLICT DO NOTHING",
+        await queries.ADD_USER.execute(
+            self.conn,
             user_id,
             datetime.now(timezone.utc)
         )
@@ -30,37 +31,53 @@ class Repo:
 
     async def list_active_users(self) -> List:
         """List all bot users"""
-        rows = await self.conn.fetch(
-                "select id from users where feed_active = true",
-            )
+        rows = await queries.LIST_ACTIVE_USERS.fetch(self.conn)
         return rows
 
 
+    async def claim_due_users(self, now: datetime) -> List[int]:
+        """Take the active users whose digest is due and move their next due time on by their frequency.
+        Users claimed by another replica at the same moment are skipped"""
+        rows = await queries.CLAIM_DUE_USERS.fetch(
+            self.conn,
+            now,
+        )
+        return [row["id"] for row in rows]
+
+
+    async def next_due(self) -> Optional[datetime]:
+        """Time the next active user is due, None without active users"""
+        row = await queries.NEXT_DUE.fetchrow(self.conn)
+        return row["next_due"]
+
+
     async def get_last_sent(self, user_id) -> datetime:
-        row = await self.conn.fetchrow(
-            "SELECT last_sent FROM users WHERE id = $1",
+        row = await queries.GET_LAST_SENT.fetchrow(
+            self.conn,
             user_id,
         )
         return row["last_sent"]
 
 
     async def set_last_sent(self, user_id, timestamp: datetime) -> None:
-        await self.conn.execute(
-            "update users set last_sent=$1 where id=$2",
+        await queries.SET_LAST_SENT.execute(
+            self.conn,
             timestamp,
             int(user_id),
             )
 
 
     async def set_inactive(self, user_id) -> None:
-        await self.conn.execute(
-            "update users set feed_active=false where id=$1",
+        await queries.SET_ACTIVE.execute(
+            self.conn,
+            False,
             int(user_id),
             )
 
 
     async def set_active(self, user_id) -> None:
-        await self.conn.execute(
-            "update users set feed_active=true where id=$1",
+        await queries.SET_ACTIVE.execute(
+            self.conn,
+            True,
             int(user_id),
             )
\ No newline at end of file
@@ -0,0 +1,61 @@
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable
+
+
+class FeedSchedule:
+    """Next poll time of every feed, adapted to how often the feed publishes.
+    A feed with new entries is polled again after half of the average gap between its recent entries,
+    a quiet or failing one waits twice as long as the last time, always within min_interval and max_interval.
+    Searched sites are polled every search_interval, their results have no timestamps to adapt to"""
+
+    def __init__(self, min_interval: float = 60, max_interval: float = 86400, history: int = 10, search_interval: float = 3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.search_interval = search_interval
+        self.history = history #entry timestamps kept per feed
+        self._due: Dict[str, float] = {}
+        self._interval: Dict[str, float] = {}
+        self._published: Dict[str, Deque[float]] = {}
+
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+
+    def is_due(self, feed_link: str, now: float) -> bool:
+        """The feeds not polled yet are due at once"""
+        return self._due.get(feed_link, 0) <= now
+
+
+    def record(self, feed_link: str, published: Iterable[datetime], failed: bool, now: float) -> None:
+        """Schedule the next poll after the feed has been polled, with the timestamps of its new entries"""
+        timestamps = self._published.setdefault(feed_link, deque(maxlen=self.history))
+        new = sorted(timestamp.timestamp() for timestamp in published)
+        if new and not failed:
+            timestamps.extend(new)
+            recent = sorted(timestamps)
+            if len(recent) > 1:
+                interval = (recent[-1] - recent[0]) / (len(recent) - 1) / 2
+            else:
+                interval = self.min_interval
+        else:
+            interval = self._interval.get(feed_link, self.min_interval) * 2
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self._interval[feed_link] = interval
+        self._due[feed_link] = now + interval
+
+
+    def record_search(self, feed_link: str, now: float) -> None:
+        """Schedule the next search of an html feed, searches only cover today so they never back off"""
+        self._interval[feed_link] = self.search_interval
+        self._due[feed_link] = now + self.search_interval
+
+
+    def retain(self, feed_links: Iterable[str]) -> None:
+        """Forget the feeds nobody follows anymore"""
+        feed_links = set(feed_links)
+        for feed_link in [feed_link for feed_link in self._due if feed_link not in feed_links]:
+            del self._due[feed_link]
+            del self._interval[feed_link]
+            self._published.pop(feed_link, None)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+
+from datetime import datetime
+from googlesearch import search # type: ignore
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+SearchBackend = Callable[[str, int], Awaitable[List[str]]] #(query, number of results) -> article links
+
+
+def google_backend() -> SearchBackend:
+    """Google search through googlesearch. The blocking call runs in the default executor of the loop,
+    a request hanging there never holds one of the fetcher's parse workers"""
+    async def backend(query: str, num_results: int) -> List[str]:
+        loop = asyncio.get_running_loop()
+        return list(await loop.run_in_executor(None, lambda: search(query, num_results=num_results)))
+    return backend
+
+
+class SearchPlanner:
+    """Runs the site searches of the html feeds. The same (keyword, site, date) is searched once for all users,
+    the results are cached for ttl seconds and the queries go out one by one from a throttled worker.
+    A failed query pauses all the searches, the queries planned meanwhile return no links at once"""
+
+    def __init__(self, backend: SearchBackend, interval: float = 2, ttl: float = 3600, num_results: int = 5,
+                 backoff: float = 30, max_backoff: float = 3600, timeout: float = 30):
+        self.backend = backend
+        self.interval = interval #seconds between two queries
+        self.ttl = ttl
+        self.num_results = num_results
+        self.backoff = backoff #pause after a failure, doubled on every failure in a row
+        self.max_backoff = max_backoff
+        self.timeout = timeout #a query taking longer counts as failed, googlesearch has no timeout of its own
+        self._failures = 0
+        self._paused_until = 0.0
+        self._cache: Dict[Tuple[str, str, str], Tuple[List[str], float]] = {} #key -> (links, expires)
+        self._pending: Dict[Tuple[str, str, str], "asyncio.Future[List[str]]"] = {}
+        self._queue: "asyncio.Queue[Tuple[str, str, str]]" = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self.queries = 0
+        self.cached = 0
+        self.skipped = 0
+
+
+    async def search(self, keyword: str, site: str) -> List[str]:
+        """Article links of the site for the keyword published today"""
+        key = (keyword.lower(), site, datetime.today().strftime('%Y-%m-%d'))
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > time.time():
+            self.cached += 1
+            return cached[0]
+        if self._paused():
+            self.skipped += 1
+            return [] #not cached, the next cycle searches again
+        future = self._pending.get(key)
+        if future is None: #otherwise the same query is already planned for another user
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            self._queue.put_nowait(key)
+            if self._worker is None or self._worker.done():
+                self._worker = asyncio.create_task(self._run())
+        return await asyncio.shield(future)
+
+
+    def _paused(self) -> bool:
+        return time.time() < self._paused_until
+
+
+    async def _run(self) -> None:
+        while True:
+            key = await self._queue.get()
+            if self._paused():
+                self.skipped += 1
+                self._pending.pop(key).set_result([]) #the feeds waiting on it are not held for the pause
+                continue
+            keyword, site, date = key
+            links: List[str] = []
+            try:
+                links = await asyncio.wait_for(
+                    self.backend(f"{keyword} site:{site} after:{date}", self.num_results),
+                    self.timeout,
+                    )
+                self._cache[key] = (links, time.time() + self.ttl) #failures are not cached, the next cycle tries again
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                pause = min(self.backoff * 2 ** (self._failures - 1), self.max_backoff)
+                self._paused_until = time.time() + pause
+                _log(f"Search for {keyword} on {site} has failed, pausing the searches for {pause:.0f}s: {e!r}")
+            self.queries += 1
+            self._pending.pop(key).set_result(links)
+            self._expire()
+            await asyncio.sleep(self.interval)
+
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key in [key for key, (_, expires) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+
+
+    def stats(self) -> str:
+        return (f"Search: {self.queries} queries, {self.cached} served from the cache, {self.skipped} skipped while paused, "
+                f"{self._queue.qsize()} waiting")
+
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        for future in self._pending.values():
+            future.cancel()
@@ -0,0 +1,143 @@
+import json
+import logging
+import time
+
+from datetime import datetime, timezone
+from hashlib import blake2b
+from tgbot.config import CacheConfig
+from tgbot.models.validator import ValidatorData
+from typing import Dict, List, Optional, Sequence, Tuple
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class LocalCache:
+    """In-process stand-in for RedisCache with the same interface, for tests and single-process runs"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, float]] = {} #key -> (value, expires)
+        self._sets: Dict[str, Dict[str, float]] = {} #key -> member -> score
+
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self._values.get(key)
+        if value is None:
+            return None
+        if value[1] <= time.time():
+            del self._values[key]
+            return None
+        return value[0]
+
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return [self._get(key) for key in keys]
+
+
+    async def set_many(self, values: Dict[str, str], ttl: float) -> None:
+        expires = time.time() + ttl
+        for key, value in values.items():
+            self._values[key] = (value, expires)
+
+
+    async def add_scored(self, items: Sequence[Tuple[str, str, float]], min_score: float) -> None:
+        """Add (key, member, score) to the scored sets and drop the members below min_score"""
+        for key, member, score in items:
+            self._sets.setdefault(key, {})[member] = score
+        for key in {key for key, _, _ in items}:
+            self._sets[key] = {member: score for member, score in self._sets[key].items() if score >= min_score}
+
+
+    async def has_scored(self, items: Sequence[Tuple[str, str]], min_score: float) -> List[bool]:
+        """Whether each (key, member) is in its set with a score of at least min_score"""
+        return [self._sets.get(key, {}).get(member, min_score - 1) >= min_score for key, member in items]
+
+
+    async def close(self) -> None:
+        return
+
+
+class RedisCache:
+    """Cache tier shared by all the processes, every batch of commands is sent in one pipeline"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+
+    @classmethod
+    async def connect(cls, address: str) -> "RedisCache":
+        import aioredis # type: ignore #only needed with the redis tier
+        return cls(await aioredis.create_redis_pool(address, encoding="utf-8"))
+
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return await self.redis.mget(*keys)
+
+
+    async def set_many(self, values: Dict[str, str], ttl: float) -> None:
+        if not values:
+            return
+        pipe = self.redis.pipeline()
+        for key, value in values.items():
+            pipe.set(key, value, pexpire=int(ttl * 1000))
+        await pipe.execute()
+
+
+    async def add_scored(self, items: Sequence[Tuple[str, str, float]], min_score: float) -> None:
+        if not items:
+            return
+        pipe = self.redis.pipeline()
+        for key, member, score in items:
+            pipe.zadd(key, score, member)
+        for key in {key for key, _, _ in items}:
+            pipe.zremrangebyscore(key, max=min_score, exclude=self.redis.ZSET_EXCLUDE_MAX)
+            pipe.expire(key, int(time.time() - min_score) + 1) #the whole set expires with its newest member
+        await pipe.execute()
+
+
+    async def has_scored(self, items: Sequence[Tuple[str, str]], min_score: float) -> List[bool]:
+        if not items:
+            return []
+        pipe = self.redis.pipeline()
+        for key, member in items:
+            pipe.zscore(key, member)
+        scores = await pipe.execute()
+        return [score is not None and score >= min_score for score in scores]
+
+
+    async def close(self) -> None:
+        self.redis.close()
+        await self.redis.wait_closed()
+
+
+async def create_shared_cache(config: CacheConfig):
+    """The configured shared tier: redis, the local stand-in or none"""
+    if config.shared == "redis":
+        _log(f"Using the redis cache tier at {config.redis_address}")
+        return await RedisCache.connect(config.redis_address)
+    if config.shared == "local":
+        return LocalCache()
+    return None
+
+
+def sent_key(user_id: int, link: str) -> Tuple[str, str]:
+    """Set key and member of a sent link, links are stored as 8-byte hashes"""
+    return f"sent:{int(user_id)}", blake2b(link.encode(), digest_size=8).hexdigest()
+
+
+def dump_validator(validator: ValidatorData) -> str:
+    watermark = validator.watermark.timestamp() if validator.watermark is not None else None
+    return json.dumps([validator.etag, validator.last_modified, validator.content_hash, watermark])
+
+
+def load_validator(feed_link: str, value: str) -> ValidatorData:
+    etag, last_modified, content_hash, *rest = json.loads(value) #values cached before the watermark have three fields
+    watermark = datetime.fromtimestamp(rest[0], timezone.utc) if rest and rest[0] is not None else None
+    return ValidatorData(feed_link, etag, last_modified, content_hash, watermark)
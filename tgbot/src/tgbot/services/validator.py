@@ -0,0 +1,72 @@
+import logging
+
+from datetime import datetime, timezone
+from tgbot.models.validator import ValidatorData
+from tgbot.services import queries
+from tgbot.services.shared_cache import dump_validator, load_validator
+from typing import Any, Dict, Iterable, List, Optional
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+class ValidatorCache:
+    """HTTP validators (ETag, Last-Modified, content hash) of the fetched feeds.
+    With a shared tier they are read from there first and the database is only asked for the missing ones"""
+
+    def __init__(self, conn = None, shared: Optional[Any] = None, ttl: float = 86400):
+        self.conn = conn
+        self.shared = shared
+        self.ttl = ttl
+
+
+    async def get_validators(self, feed_links: Iterable[str]) -> Dict[str, ValidatorData]:
+        """Load the stored validators of the feed links"""
+        feed_links = list(feed_links)
+        validators: Dict[str, ValidatorData] = {}
+        if self.shared is not None:
+            values = await self.shared.get_many([f"validator:{feed_link}" for feed_link in feed_links])
+            validators = {
+                feed_link: load_validator(feed_link, value)
+                for feed_link, value in zip(feed_links, values)
+                if value is not None
+                }
+            feed_links = [feed_link for feed_link in feed_links if feed_link not in validators]
+        if not feed_links:
+            return validators
+        rows = await queries.GET_VALIDATORS.fetch(
+            self.conn,
+            feed_links,
+        )
+        loaded = {
+            row["feed_link"]: ValidatorData(
+                row["feed_link"],
+                row["etag"],
+                row["last_modified"],
+                row["content_hash"],
+                row["watermark"],
+                )
+            for row in rows
+            }
+        if self.shared is not None:
+            await self.shared.set_many({f"validator:{v.feed_link}": dump_validator(v) for v in loaded.values()}, self.ttl)
+        validators.update(loaded)
+        return validators
+
+
+    async def save_validators(self, validators: List[ValidatorData]) -> None:
+        if not validators:
+            return
+        checked = datetime.now(timezone.utc)
+        await queries.SAVE_VALIDATOR.executemany(
+            self.conn,
+            [(v.feed_link, v.etag, v.last_modified, v.content_hash, v.watermark, checked) for v in validators],
+            )
+        if self.shared is not None:
+            await self.shared.set_many({f"validator:{v.feed_link}": dump_validator(v) for v in validators}, self.ttl)
+        return
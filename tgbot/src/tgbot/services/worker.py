@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import socket
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler # type: ignore
+from tgbot.config import Config
+from tgbot.services.delivery import Delivery
+from tgbot.services.fetcher import Fetcher
+from tgbot.services.job_lock import JobLock
+from tgbot.services.link import Link
+from tgbot.services.link_cache import SentLinkCache
+from tgbot.services.matcher import MatcherCache
+from tgbot.services.outbox_worker import OutboxWorker
+from tgbot.services.pipeline import SubscriptionPipeline
+from tgbot.services.reaper import LinkReaper
+from tgbot.services.schedule import FeedSchedule
+from tgbot.services.search import SearchPlanner, google_backend
+from typing import Any, Optional
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+async def subscription_loop(pipeline: SubscriptionPipeline, lock: Optional[JobLock], interval: float) -> None:
+    """Run a cycle whenever the next user is due, skipped cycles wait the whole interval"""
+    while True:
+        wait = interval
+        try:
+            ran = True
+            if lock is None:
+                await pipeline.run()
+            else:
+                ran = await lock.run(pipeline.run)
+            if ran:
+                wait = await pipeline.next_run(interval)
+        except Exception as e:
+            _log(f"Subscription cycle has failed: {e!r}")
+        await asyncio.sleep(wait)
+
+
+async def outbox_loop(outbox_worker: OutboxWorker, lock: JobLock, interval: float) -> None:
+    """Deliver the outbox while this process holds the lock, the others take over when it goes away.
+    One process sends at a time, so the bot stays within the rate and per-chat limits of a single Delivery"""
+    while True:
+        try:
+            await lock.run(outbox_worker.run)
+        except Exception as e:
+            _log(f"Outbox delivery has stopped: {e!r}")
+        await asyncio.sleep(interval)
+
+
+async def reaper_loop(reaper: LinkReaper, lock: JobLock) -> None:
+    await lock.run(reaper.run)
+
+
+class Worker:
+    """Feed polling, outbox delivery and cleanup. Runs inside the bot process or on its own from worker.py,
+    several workers share the feeds through Postgres and one of them at a time delivers the outbox"""
+
+    def __init__(self, config: Config, pool, bot, shared: Optional[Any] = None):
+        self.config = config
+        self.pool = pool
+        self.name = f"{socket.gethostname()}:{os.getpid()}" #owner of the feed leases
+        self.link_cache = SentLinkCache(config.cache.sent_links, shared=shared)
+        self.fetcher = Fetcher(
+            concurrency=config.fetch.concurrency,
+            per_host=config.fetch.per_host,
+            timeout=config.fetch.timeout,
+            parse_workers=config.fetch.parse_workers,
+            max_bytes=config.fetch.max_bytes,
+            max_entries=config.fetch.max_entries,
+        )
+        delivery = Delivery(
+            bot,
+            rate=config.delivery.rate,
+            chat_interval=config.delivery.chat_interval,
+            digest_size=config.delivery.digest_size,
+            max_retries=config.delivery.max_retries,
+        )
+        self.outbox_worker = OutboxWorker(
+            pool,
+            delivery,
+            self.link_cache,
+            batch_size=config.outbox.batch_size,
+            interval=config.outbox.interval,
+            lease=config.outbox.lease,
+            max_attempts=config.outbox.max_attempts,
+        )
+        self.planner = SearchPlanner(
+            google_backend(),
+            interval=config.search.interval,
+            ttl=config.search.ttl,
+            num_results=config.search.num_results,
+            backoff=config.search.backoff,
+            max_backoff=config.search.max_backoff,
+            timeout=config.search.timeout,
+        )
+        self.pipeline = SubscriptionPipeline(
+            pool,
+            self.outbox_worker,
+            self.fetcher,
+            self.planner,
+            self.link_cache,
+            MatcherCache(),
+            FeedSchedule(config.poll.min_interval, config.poll.max_interval, config.poll.history, config.poll.search_interval),
+            refresh=config.pipeline.schedule_refresh,
+            queue_size=config.pipeline.queue_size,
+            page_size=config.pipeline.page_size,
+            fetch_workers=config.pipeline.fetch_workers,
+            match_workers=config.pipeline.match_workers,
+            dedupe_workers=config.pipeline.dedupe_workers,
+            persist_workers=config.pipeline.persist_workers,
+            owner=self.name,
+            feed_lease=config.worker.feed_lease,
+            shared=shared,
+            validator_ttl=config.cache.validator_ttl,
+            failure_threshold=config.health.failure_threshold,
+            cooldown=config.health.cooldown,
+            max_cooldown=config.health.max_cooldown,
+        )
+        self.reaper = LinkReaper(
+            pool,
+            self.link_cache,
+            batch_size=config.reaper.batch_size,
+            pause=config.reaper.pause,
+        )
+        self.scheduler = AsyncIOScheduler()
+        #logging.getLogger('apscheduler').setLevel(logging.DEBUG) #comment to switch off the apscheduler logging
+        #exclusive cycles run on one replica at a time, otherwise all the workers run them and split the feeds by the leases
+        self.subscription_lock = JobLock(pool, JobLock.SUBSCRIPTION, "subscription cycle") if config.worker.exclusive else None
+        #an overrunning job is skipped by its lock, the scheduler only has to let it start and not stack the missed runs
+        self.scheduler.add_job(reaper_loop, "interval", seconds=config.reaper.interval, args=(self.reaper, JobLock(pool, JobLock.REAPER, "reaper")),
+                               max_instances=2, coalesce=True)
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._subscription_task: Optional[asyncio.Task] = None
+
+
+    async def start(self) -> None:
+        async with self.pool.acquire() as conn:
+            await Link(conn, self.link_cache).warm_cache()
+        _log(f"Worker {self.name} started, {self.link_cache.stats()}")
+        self._outbox_task = asyncio.create_task( #delivers what is left from the previous run too
+            outbox_loop(self.outbox_worker, JobLock(self.pool, JobLock.OUTBOX, "outbox delivery", quiet=True), self.config.outbox.interval)
+            )
+        self._subscription_task = asyncio.create_task(
+            subscription_loop(self.pipeline, self.subscription_lock, self.config.worker.interval)
+            )
+        self.scheduler.start()
+
+
+    async def close(self) -> None:
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        for task in (self._subscription_task, self._outbox_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await self.planner.close()
+        await self.fetcher.close()
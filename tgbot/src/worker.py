@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot # type: ignore
+
+from tgbot.config import load_config
+from tgbot.services.connection import create_pool
+from tgbot.services.shared_cache import create_shared_cache
+from tgbot.services.worker import Worker
+
+def _log(obj) -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    )
+    logger = logging.getLogger(__name__)
+    logger.error(obj)
+
+
+async def main():
+    """Poll the feeds and deliver the digests without serving the bot updates.
+    Run any number of these next to bot.py with [worker] embedded = false"""
+    _log("Starting worker")
+    config = load_config("bot.ini")
+
+    pool = await create_pool(config)
+    shared = await create_shared_cache(config.cache)
+    bot = Bot(token=config.tg_bot.token) #only sends the digests
+    worker = Worker(config, pool, bot, shared)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await worker.start()
+        await stop.wait()
+    finally:
+        await worker.close()
+        await bot.session.close()
+        if shared is not None:
+            await shared.close()
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+    _log("Worker stopped!")